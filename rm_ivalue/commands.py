@@ -0,0 +1,126 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import json
+import os
+import sys
+
+import click
+import frappe
+from frappe.commands import pass_context
+from frappe.exceptions import SiteNotSpecifiedError
+
+@click.command("rm-ivalue-reconcile-counters")
+@click.option("--dry-run", is_flag=True, default=False, help="Only report drift, do not repair it")
+@pass_context
+def reconcile_counters(context, dry_run=False):
+    """Detect and repair drift in the Project Assignment status counters"""
+    from rm_ivalue.rm_ivalue.status_counters import reconcile_status_counters
+
+    if not context.sites:
+        raise SiteNotSpecifiedError
+
+    for site in context.sites:
+        frappe.init(site=site)
+        frappe.connect()
+        try:
+            drift = reconcile_status_counters(repair=not dry_run)
+            frappe.db.commit()
+
+            if not drift:
+                click.echo(f"{site}: counters are consistent")
+            for row in drift:
+                click.echo(
+                    f"{site}: {row['status']} count {row['count']} -> {row['expected_count']}, "
+                    f"submitted {row['submitted_count']} -> {row['expected_submitted_count']}"
+                    + (" (not repaired)" if dry_run else " (repaired)")
+                )
+        finally:
+            frappe.destroy()
+
+@click.command("rm-ivalue-daily")
+@click.option("--processes", type=int, help="Sites processed in parallel (default 4)")
+@click.option("--per-db-host", type=int, help="Sites processed at once per database server (default 2)")
+@click.option("--retries", type=int, help="Retry rounds for failed sites (default 1)")
+@pass_context
+def run_daily(context, processes=None, per_db_host=None, retries=None):
+    """Run the rm_ivalue daily maintenance for many sites in parallel"""
+    from rm_ivalue.rm_ivalue.multisite import get_summary_totals, run_daily_for_sites
+
+    if not context.sites:
+        raise SiteNotSpecifiedError
+
+    summary = run_daily_for_sites(
+        context.sites, os.path.abspath("."), processes=processes, per_db_host=per_db_host, retries=retries
+    )
+
+    for result in summary["results"]:
+        click.echo(
+            f"{result['site']}: {result['status']} in {result['seconds']}s, "
+            f"{result['updated']} updated, {result['drift']} counters repaired, "
+            f"{result['repaired']} names resynced"
+            + (f", {result['attempts']} attempts" if result["attempts"] > 1 else "")
+            + (f" ({result['error']})" if result["error"] else "")
+        )
+
+    totals = get_summary_totals(summary)
+    click.echo(
+        f"{totals['sites']} sites in {totals['seconds']}s ({totals['site_seconds']}s of site time): "
+        f"{totals['ok']} ok, {totals['skipped']} skipped, {totals['failed']} failed, "
+        f"{totals['updated']} assignments updated"
+    )
+
+    if totals["failed"]:
+        sys.exit(1)
+
+@click.command("rm-ivalue-stress-change-requests")
+@click.option("--employee", required=True, help="Employee of the test assignment")
+@click.option("--project", required=True, help="Project of the test assignment")
+@click.option("--workers", type=int, default=8, help="Parallel worker processes (default 8)")
+@click.option("--requests", type=int, default=25, help="Change requests per worker (default 25)")
+@click.option("--output", help="Also write the full results as JSON to this file")
+@pass_context
+def stress_change_requests(context, employee, project, workers=8, requests=25, output=None):
+    """Stress test concurrent change requests against one assignment. Use a test site."""
+    from rm_ivalue.rm_ivalue.stress import run_change_request_stress
+
+    if not context.sites:
+        raise SiteNotSpecifiedError
+
+    site = context.sites[0]
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        frappe.set_user("Administrator")
+        result = run_change_request_stress(
+            site, os.path.abspath(frappe.local.sites_path), employee, project, workers=workers, requests=requests
+        )
+    finally:
+        frappe.destroy()
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(result, f, indent=1, default=str)
+
+    outcomes = result["outcomes"]
+    database = result["database"]
+    click.echo(
+        f"{database['version']}, {database['transaction_isolation']}, "
+        f"innodb_lock_wait_timeout {database['innodb_lock_wait_timeout']}s"
+    )
+    click.echo(
+        f"{result['requests']} change requests from {result['workers']} workers on {result['assignment']} "
+        f"in {result['seconds']}s: {result['throughput']} committed/s, "
+        f"p50 {result['p50_ms']}ms, p95 {result['p95_ms']}ms"
+    )
+    click.echo(", ".join(f"{count} {outcome}" for outcome, count in outcomes.items()))
+    for error in result["errors"]:
+        click.echo(f"error: {error}")
+    for problem in result["problems"]:
+        click.echo(f"FAILED: {problem}")
+
+    if result["problems"] or outcomes["error"]:
+        sys.exit(1)
+    click.echo("No duplicate or overlapping splits")
+
+commands = [reconcile_counters, run_daily, stress_change_requests]
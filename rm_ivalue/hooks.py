@@ -145,6 +145,33 @@ app_license = "mit"
 # 	}
 # }
 
+doc_events = {
+	"Employee": {
+		"on_update": [
+			"rm_ivalue.rm_ivalue.costing.on_employee_update",
+			"rm_ivalue.rm_ivalue.denormalization.on_employee_update"
+		]
+	},
+	"Project": {
+		"on_update": [
+			"rm_ivalue.rm_ivalue.denormalization.on_project_update",
+			"rm_ivalue.rm_ivalue.report.project_staffing_rollup.project_staffing_rollup.on_project_change"
+		],
+		"after_insert": "rm_ivalue.rm_ivalue.report.project_staffing_rollup.project_staffing_rollup.on_project_change",
+		"on_trash": "rm_ivalue.rm_ivalue.report.project_staffing_rollup.project_staffing_rollup.on_project_change"
+	},
+	"Holiday List": {
+		"on_update": [
+			"rm_ivalue.rm_ivalue.working_days.clear_working_day_calendar",
+			"rm_ivalue.rm_ivalue.costing.on_holiday_list_update"
+		],
+		"on_trash": "rm_ivalue.rm_ivalue.working_days.clear_working_day_calendar"
+	},
+	"Company": {
+		"on_update": "rm_ivalue.rm_ivalue.costing.on_company_update"
+	},
+}
+
 # Scheduled Tasks
 # ---------------
 
@@ -194,6 +221,9 @@ scheduler_events = {
 
 # ignore_links_on_delete = ["Communication", "ToDo"]
 
+# History and the change log outlive the assignment, so they must not block deleting a draft or cancelled assignment
+ignore_links_on_delete = ["Project Assignment History", "Assignment Change Log"]
+
 # Request Events
 # ----------------
 # before_request = ["rm_ivalue.utils.before_request"]
@@ -0,0 +1,90 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import re
+
+import frappe
+from frappe.utils import add_days, flt, getdate
+from rm_ivalue.rm_ivalue.change_log import insert_change_log_rows
+
+END_DATE_PATTERN = re.compile(r"^End date changed from (\S+) to (\S+)\. Reason: (.*)$", re.DOTALL)
+ALLOCATION_PATTERN = re.compile(
+    r"^Allocation changed from ([\d.]+)% to ([\d.]+)% effective (\S+)\. New assignment created: (\S+)$", re.DOTALL
+)
+ALLOCATION_REASON_PATTERN = re.compile(r"Reason: (.*)$", re.DOTALL)
+
+def execute():
+    """Convert the free-text change request comments of Project Assignments into Assignment Change Log rows"""
+    if frappe.db.count("Assignment Change Log"):
+        return
+
+    comments = frappe.get_all(
+        "Comment",
+        filters={"reference_doctype": "Project Assignment", "comment_type": "Info"},
+        fields=["reference_name", "content", "creation", "owner"],
+        order_by="creation asc"
+    )
+    if not comments:
+        return
+
+    assignments = {
+        row.name: row for row in frappe.db.sql("""
+            SELECT name, employee, project, end_date, allocation_reference
+            FROM `tabProject Assignment`
+            UNION ALL
+            SELECT name, employee, project, end_date, allocation_reference
+            FROM `tabArchived Project Assignment`
+        """, as_dict=True)
+    }
+
+    entries = []
+    for comment in comments:
+        assignment = assignments.get(comment.reference_name)
+        entry = parse_comment(comment, assignment, assignments) if assignment else None
+        if entry:
+            entries.append(entry)
+
+    for start in range(0, len(entries), 1000):
+        insert_change_log_rows(entries[start:start + 1000])
+
+def parse_comment(comment, assignment, assignments):
+    """Get a change log entry from a change request comment, or None for other comments"""
+    content = (comment.content or "").strip()
+    entry = {
+        "assignment": assignment.name,
+        "employee": assignment.employee,
+        "project": assignment.project,
+        "changed_on": comment.creation,
+        "changed_by": comment.owner
+    }
+
+    match = END_DATE_PATTERN.match(content)
+    if match:
+        entry.update({
+            "change_type": "End Date",
+            "old_end_date": getdate(match.group(1)),
+            "new_end_date": getdate(match.group(2)),
+            "reason": match.group(3)
+        })
+        return entry
+
+    match = ALLOCATION_PATTERN.match(content)
+    if match:
+        # The allocation comment had no reason; the reference note written with it does
+        reason = ALLOCATION_REASON_PATTERN.search(assignment.allocation_reference or "")
+        effective_date = getdate(match.group(3))
+        new_assignment = assignments.get(match.group(4))
+        entry.update({
+            "change_type": "Allocation",
+            "old_allocation_percentage": flt(match.group(1)),
+            "new_allocation_percentage": flt(match.group(2)),
+            "effective_date": effective_date,
+            # The split assignment runs to the original end date
+            "old_end_date": new_assignment.end_date if new_assignment else None,
+            "new_end_date": add_days(effective_date, -1),
+            "new_assignment": match.group(4),
+            "reason": reason.group(1) if reason else None
+        })
+        return entry
+
+    return None
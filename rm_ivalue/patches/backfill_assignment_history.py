@@ -0,0 +1,92 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.utils import cint
+from rm_ivalue.rm_ivalue.assignment_history import OPEN_VALID_TO, STATE_FIELDS, insert_history_rows
+
+BATCH_SIZE = 500
+
+def execute():
+    """Rebuild the valid-time history of existing assignments from their Version log.
+
+    Starting from the current state, each Version is undone from newest to
+    oldest. Changes written with frappe.db.set_value (change requests, status
+    updates) left no Version, so those are folded into the neighbouring state.
+    Assignments that already have history rows, e.g. written by another patch
+    during the same migration, are only rebuilt up to their earliest row."""
+    assignments = frappe.db.sql("""
+        SELECT name, creation, docstatus, {fields}
+        FROM `tabProject Assignment`
+        UNION ALL
+        SELECT name, creation, 1 as docstatus, {fields}
+        FROM `tabArchived Project Assignment`
+    """.format(fields=", ".join(STATE_FIELDS)), as_dict=True)
+
+    earliest = get_earliest_history_rows()
+    assignments = [
+        assignment for assignment in assignments
+        if assignment.name not in earliest or earliest[assignment.name].valid_from > assignment.creation
+    ]
+
+    for start in range(0, len(assignments), BATCH_SIZE):
+        batch = assignments[start:start + BATCH_SIZE]
+        versions = {}
+        for version in frappe.get_all(
+            "Version",
+            filters={"ref_doctype": "Project Assignment", "docname": ["in", [row.name for row in batch]]},
+            fields=["docname", "data", "creation"],
+            order_by="creation desc"
+        ):
+            versions.setdefault(version.docname, []).append(version)
+
+        rows = []
+        for assignment in batch:
+            rows.extend(get_history_rows(assignment, versions.get(assignment.name, []), earliest.get(assignment.name)))
+
+        insert_history_rows(rows)
+        frappe.db.commit()
+
+def get_earliest_history_rows():
+    """Get the earliest recorded history row of each assignment"""
+    return {
+        row.assignment: row for row in frappe.db.sql("""
+            SELECT history.assignment, history.assignment_docstatus as docstatus, history.valid_from, {fields}
+            FROM `tabProject Assignment History` history
+            INNER JOIN (
+                SELECT assignment, MIN(valid_from) as valid_from
+                FROM `tabProject Assignment History`
+                GROUP BY assignment
+            ) earliest ON earliest.assignment = history.assignment AND earliest.valid_from = history.valid_from
+        """.format(fields=", ".join(f"history.{field}" for field in STATE_FIELDS)), as_dict=True)
+    }
+
+def get_history_rows(assignment, versions, earliest=None):
+    """Get history rows of one assignment from its Versions, newest first.
+
+    With an earliest recorded row, only the time before it is rebuilt,
+    starting from its state."""
+    tracked = set(STATE_FIELDS) | {"docstatus"}
+    start = earliest or assignment
+    state = frappe._dict({field: start.get(field) for field in tracked})
+    valid_to = earliest.valid_from if earliest else OPEN_VALID_TO
+    rows = []
+
+    for version in versions:
+        if earliest and version.creation >= earliest.valid_from:
+            continue
+
+        changed = [
+            change for change in (frappe.parse_json(version.data or "{}").get("changed") or [])
+            if change[0] in tracked
+        ]
+        if not changed:
+            continue
+
+        rows.append((assignment.name, cint(state.docstatus), frappe._dict(state), version.creation, valid_to))
+        for field, old_value, new_value in changed:
+            state[field] = old_value
+        valid_to = version.creation
+
+    rows.append((assignment.name, cint(state.docstatus), state, assignment.creation, valid_to))
+    return rows
@@ -0,0 +1,8 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+from rm_ivalue.rm_ivalue.status_counters import reconcile_status_counters
+
+def execute():
+    """Seed the status counters from the existing assignments"""
+    reconcile_status_counters(repair=True)
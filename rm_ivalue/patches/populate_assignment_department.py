@@ -0,0 +1,8 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+from rm_ivalue.rm_ivalue.denormalization import repair_denormalized_attributes
+
+def execute():
+    """Fill the new department copy and refresh stale employee and project names on existing assignments"""
+    repair_denormalized_attributes()
@@ -0,0 +1,8 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+from rm_ivalue.rm_ivalue.costing import recompute_costs
+
+def execute():
+    """Compute working days and estimated cost for existing assignments"""
+    recompute_costs("1 = 1", {})
@@ -0,0 +1,101 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+from frappe.utils import add_days, date_diff, flt, getdate
+
+def get_overlap_days(start_date, end_date, window_start, window_end):
+    """Get the number of days (inclusive) an assignment overlaps a window"""
+    start_date = max(getdate(start_date), getdate(window_start))
+    end_date = min(getdate(end_date), getdate(window_end))
+    if end_date < start_date:
+        return 0
+    return date_diff(end_date, start_date) + 1
+
+def get_daily_allocation_profile(assignments, window_start, window_end):
+    """Get the total allocation percentage for every day of a window.
+
+    Uses a difference array so the cost is O(assignments + days) instead of
+    O(assignments x days). Index 0 of the result is window_start."""
+    window_start = getdate(window_start)
+    window_end = getdate(window_end)
+    window_days = date_diff(window_end, window_start) + 1
+    if window_days <= 0:
+        return []
+
+    diff = [0.0] * (window_days + 1)
+    for assignment in assignments:
+        start_index = max(date_diff(assignment.start_date, window_start), 0)
+        end_index = min(date_diff(assignment.end_date, window_start), window_days - 1)
+        if end_index < start_index:
+            continue
+        allocation = flt(assignment.allocation_percentage)
+        diff[start_index] += allocation
+        diff[end_index + 1] -= allocation
+
+    profile = []
+    running = 0.0
+    for day in range(window_days):
+        running += diff[day]
+        profile.append(flt(running, 2))
+
+    return profile
+
+def get_allocation_segments(assignments):
+    """Get the allocation skyline of a set of assignments.
+
+    Returns ordered (start_date, end_date, allocation) tuples of constant,
+    non-zero total allocation. Days not covered by any segment are free."""
+    events = {}
+    for assignment in assignments:
+        allocation = flt(assignment.allocation_percentage)
+        if not allocation:
+            continue
+        start_date = getdate(assignment.start_date)
+        end_date = add_days(getdate(assignment.end_date), 1)
+        events[start_date] = events.get(start_date, 0) + allocation
+        events[end_date] = events.get(end_date, 0) - allocation
+
+    segments = []
+    running = 0.0
+    breakpoints = sorted(events)
+    for index, day in enumerate(breakpoints[:-1]):
+        running = flt(running + events[day], 2)
+        if running:
+            segment_end = add_days(breakpoints[index + 1], -1)
+            if segments and segments[-1][2] == running and add_days(segments[-1][1], 1) == day:
+                segments[-1] = (segments[-1][0], segment_end, running)
+            else:
+                segments.append((day, segment_end, running))
+
+    return segments
+
+def find_earliest_start(segments, required_allocation, duration_days, earliest_start, latest_start=None):
+    """Find the earliest start date where a new allocation fits under 100% for its whole duration.
+
+    Walks the skyline once: every segment that would exceed 100% and overlaps the
+    candidate window pushes the candidate past its end."""
+    candidate = getdate(earliest_start)
+    capacity = 100 - flt(required_allocation)
+
+    for segment_start, segment_end, allocation in segments:
+        if segment_end < candidate or allocation <= capacity:
+            continue
+        if segment_start > add_days(candidate, duration_days - 1):
+            break
+        candidate = add_days(segment_end, 1)
+        if latest_start and candidate > getdate(latest_start):
+            return None
+
+    if latest_start and candidate > getdate(latest_start):
+        return None
+    return candidate
+
+def get_peak_allocation(segments, start_date, end_date):
+    """Get the highest allocation of a skyline within a date range"""
+    start_date = getdate(start_date)
+    end_date = getdate(end_date)
+    return max(
+        [allocation for segment_start, segment_end, allocation in segments
+         if segment_start <= end_date and segment_end >= start_date],
+        default=0
+    )
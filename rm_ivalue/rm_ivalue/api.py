@@ -1,8 +1,23 @@
 # Copyright (c) 2023, Yazan Hamdan and contributors
 # For license information, please see license.txt
 
+import base64
+import json
+
 import frappe
+from frappe.utils import add_to_date, cint, flt, get_datetime, getdate, now_datetime, today
 from rm_ivalue.rm_ivalue.tasks import update_project_assignment_status
+from rm_ivalue.rm_ivalue.assignment_cache import get_employee_assignments
+from rm_ivalue.rm_ivalue.change_log import get_change_log
+from rm_ivalue.rm_ivalue.doctype.project_assignment.project_assignment import get_team_workload
+from rm_ivalue.rm_ivalue.replica import replica_read
+from rm_ivalue.rm_ivalue.status_counters import get_status_summary, reconcile_status_counters
+from rm_ivalue.rm_ivalue.utils import parse_list
+from rm_ivalue.rm_ivalue.working_days import get_assignment_day_counts, get_holiday_lists
+
+# Order of the values returned per assignment by get_assignment_metrics
+METRIC_FIELDS = ["progress_percentage", "elapsed_days", "remaining_days", "total_days"]
+MAX_METRIC_NAMES = 1000
 
 @frappe.whitelist()
 def manual_update_project_status():
@@ -18,50 +33,52 @@ def manual_update_project_status():
         frappe.throw(f"Error updating project status: {str(e)}")
 
 @frappe.whitelist()
+@replica_read
 def get_project_assignment_summary():
     """Get summary of project assignments by status"""
     if not frappe.has_permission("Project Assignment", "read"):
         frappe.throw("Not enough permissions to read Project Assignment")
     
     try:
-        summary = frappe.db.sql("""
-            SELECT 
-                status,
-                COUNT(*) as count,
-                COUNT(CASE WHEN docstatus = 1 THEN 1 END) as submitted_count
-            FROM `tabProject Assignment`
-            WHERE docstatus != 2
-            GROUP BY status
-            ORDER BY 
-                CASE status 
-                    WHEN 'Planned' THEN 1 
-                    WHEN 'Active' THEN 2 
-                    WHEN 'Completed' THEN 3 
-                END
-        """, as_dict=True)
+        # Counters are maintained by the document lifecycle and the status job
+        summary = get_status_summary()
         
         return summary
     except Exception as e:
         frappe.throw(f"Error getting project assignment summary: {str(e)}")
 
 @frappe.whitelist()
+def reconcile_assignment_summary(repair=1):
+    """Detect, and optionally repair, drift between the status counters and the assignments"""
+    frappe.only_for("System Manager")
+    
+    try:
+        drift = reconcile_status_counters(repair=cint(repair))
+        return {"success": True, "drift": drift, "repaired": bool(cint(repair) and drift)}
+    except Exception as e:
+        frappe.throw(f"Error reconciling project assignment summary: {str(e)}")
+
+@frappe.whitelist()
+@replica_read
 def get_employee_active_assignments(employee=None):
     """Get active assignments for an employee"""
     if not frappe.has_permission("Project Assignment", "read"):
         frappe.throw("Not enough permissions to read Project Assignment")
     
-    filters = {
-        "status": "Active",
-        "docstatus": 1
-    }
-    
-    if employee:
-        filters["employee"] = employee
-    
     try:
+        if employee:
+            # Served from the per-employee index, already ordered by start date
+            return [
+                assignment for assignment in get_employee_assignments(employee)
+                if assignment.status == "Active" and assignment.docstatus == 1
+            ]
+        
         assignments = frappe.get_all(
             "Project Assignment",
-            filters=filters,
+            filters={
+                "status": "Active",
+                "docstatus": 1
+            },
             fields=[
                 "name", "project", "project_name", "employee", 
                 "employee_name", "start_date", "end_date", 
@@ -75,14 +92,14 @@ def get_employee_active_assignments(employee=None):
         frappe.throw(f"Error getting active assignments: {str(e)}")
 
 @frappe.whitelist()
-def create_end_date_change_request(assignment_name, new_end_date, reason=""):
-    """Create change request for end date modification"""
+def create_end_date_change_request(assignment_name, new_end_date, reason="", modified=None):
+    """Create change request for end date modification, rejected if the assignment changed since `modified`"""
     if not frappe.has_permission("Project Assignment", "write"):
         frappe.throw("Not enough permissions to modify Project Assignment")
     
     try:
         assignment = frappe.get_doc("Project Assignment", assignment_name)
-        result = assignment.create_change_request_for_end_date(new_end_date, reason)
+        result = assignment.create_change_request_for_end_date(new_end_date, reason, modified)
         
         return {
             "success": True,
@@ -93,15 +110,15 @@ def create_end_date_change_request(assignment_name, new_end_date, reason=""):
         frappe.throw(f"Error processing end date change request: {str(e)}")
 
 @frappe.whitelist()
-def create_allocation_change_request(assignment_name, new_allocation_percentage, effective_date, reason=""):
-    """Create change request for allocation percentage modification"""
+def create_allocation_change_request(assignment_name, new_allocation_percentage, effective_date, reason="", modified=None):
+    """Create change request for allocation percentage modification, rejected if the assignment changed since `modified`"""
     if not frappe.has_permission("Project Assignment", "write"):
         frappe.throw("Not enough permissions to modify Project Assignment")
     
     try:
         assignment = frappe.get_doc("Project Assignment", assignment_name)
         new_assignment_name = assignment.create_change_request_for_allocation(
-            float(new_allocation_percentage), effective_date, reason
+            float(new_allocation_percentage), effective_date, reason, modified
         )
         
         return {
@@ -114,36 +131,209 @@ def create_allocation_change_request(assignment_name, new_allocation_percentage,
         frappe.throw(f"Error processing allocation change request: {str(e)}")
 
 @frappe.whitelist()
+@replica_read
 def get_assignment_change_history(assignment_name):
     """Get change history for an assignment"""
     if not frappe.has_permission("Project Assignment", "read"):
         frappe.throw("Not enough permissions to read Project Assignment")
     
     try:
-        # Get comments for this assignment
-        comments = frappe.get_all(
-            "Comment",
-            filters={
-                "reference_doctype": "Project Assignment",
-                "reference_name": assignment_name,
-                "comment_type": "Info"
-            },
-            fields=["content", "creation", "owner"],
-            order_by="creation desc"
-        )
+        # Follow the change log links in both directions from this assignment
+        changes = get_change_log([assignment_name])
+        related_names = {assignment_name}
+        for change in changes:
+            related_names.add(change.assignment)
+            if change.new_assignment:
+                related_names.add(change.new_assignment)
         
-        # Get related assignments (created from this assignment or vice versa)
+        # Archived assignments stay part of the history
         related_assignments = frappe.db.sql("""
-            SELECT name, allocation_reference, start_date, end_date, allocation_percentage, status
+            SELECT name, allocation_reference, start_date, end_date, allocation_percentage, status, 0 as archived
             FROM `tabProject Assignment`
-            WHERE (allocation_reference LIKE %s OR name = %s)
+            WHERE name IN %(names)s
             AND docstatus != 2
+            UNION ALL
+            SELECT name, allocation_reference, start_date, end_date, allocation_percentage, status, 1 as archived
+            FROM `tabArchived Project Assignment`
+            WHERE name IN %(names)s
             ORDER BY start_date
-        """, (f"%{assignment_name}%", assignment_name), as_dict=True)
+        """, {"names": list(related_names)}, as_dict=True)
         
         return {
-            "comments": comments,
+            "changes": changes,
             "related_assignments": related_assignments
         }
     except Exception as e:
         frappe.throw(f"Error getting assignment change history: {str(e)}")
+
+@frappe.whitelist()
+def get_employee_workload(employees, start_date=None, end_date=None, include_profile=1, as_of=None):
+    """Get window-aware workload for one or more employees, optionally as planned at the end of a past date"""
+    if not frappe.has_permission("Project Assignment", "read"):
+        frappe.throw("Not enough permissions to read Project Assignment")
+    
+    employees = parse_list(employees)
+    
+    try:
+        workload = get_team_workload(employees, start_date, end_date, as_of)
+        
+        if not cint(include_profile):
+            for employee_workload in workload.values():
+                employee_workload.pop("daily_profile")
+        
+        return workload
+    except Exception as e:
+        frappe.throw(f"Error getting employee workload: {str(e)}")
+
+@frappe.whitelist()
+@replica_read
+def get_assignment_metrics(names):
+    """Get working-day progress metrics for a page of assignments in one query.
+
+    Returns {"fields": METRIC_FIELDS, "metrics": {name: [values in field order]}}"""
+    if not frappe.has_permission("Project Assignment", "read"):
+        frappe.throw("Not enough permissions to read Project Assignment")
+    
+    names = parse_list(names)
+    if len(names) > MAX_METRIC_NAMES:
+        frappe.throw(f"Cannot compute metrics for more than {MAX_METRIC_NAMES} assignments at once")
+    if not names:
+        return {"fields": METRIC_FIELDS, "metrics": {}}
+    
+    try:
+        assignments = frappe.db.sql("""
+            SELECT name, employee, start_date, end_date
+            FROM `tabProject Assignment`
+            WHERE name IN %(names)s
+        """, {"names": names}, as_dict=True)
+        
+        # Calendars are cached per holiday list, so each row is a few array lookups
+        holiday_lists = get_holiday_lists(list({assignment.employee for assignment in assignments}))
+        today_date = getdate(today())
+        
+        metrics = {}
+        for assignment in assignments:
+            counts = get_assignment_day_counts(
+                assignment.start_date, assignment.end_date,
+                holiday_lists.get(assignment.employee), today_date
+            )
+            counts["progress_percentage"] = flt(counts["progress_percentage"], 1)
+            metrics[assignment.name] = [counts[field] for field in METRIC_FIELDS]
+        
+        return {"fields": METRIC_FIELDS, "metrics": metrics}
+    except Exception as e:
+        frappe.throw(f"Error getting assignment metrics: {str(e)}")
+
+@frappe.whitelist()
+def get_assignment_changes(cursor=None, limit=500):
+    """Get Project Assignments inserted, updated, cancelled, status-flipped, deleted or archived since a cursor.
+
+    Removed assignments come back as tombstones with deleted = 1.
+
+    A row stamped before a read may commit after it, behind the cursor.
+    Every change committed within rm_ivalue_change_feed_overlap seconds of
+    its modified timestamp is delivered at least once: once the feed has
+    caught up, and at most once per window, the rows from the window before
+    the earliest unverified read up to the cursor are paged through again.
+    Late rows thus arrive within two windows, and rows can arrive more than
+    once; consumers apply changes idempotently and de-duplicate on
+    (modified, name)."""
+    if not frappe.has_permission("Project Assignment", "read"):
+        frappe.throw("Not enough permissions to read Project Assignment")
+    
+    limit = min(cint(limit) or 500, 1000)
+    position, checked_at, recheck = decode_change_cursor(cursor)
+    overlap = cint(frappe.conf.get("rm_ivalue_change_feed_overlap") or 300)
+    
+    try:
+        # Taken before reading, so anything not yet committed now was stamped after now - overlap
+        now = now_datetime()
+        changes = get_change_rows(position, None, limit)
+        if changes:
+            position = (changes[-1].modified, changes[-1].name)
+        checked_at = min(checked_at, now) if checked_at else now
+        has_more = len(changes) == limit
+        
+        late_changes = []
+        if not has_more:
+            # Passes run once per window, so a row is re-sent a few times at most, not on every poll
+            if not recheck and add_to_date(checked_at, seconds=overlap) <= now:
+                # Verify everything the reads since the last pass may have missed, up to the cursor
+                recheck = ((add_to_date(checked_at, seconds=-overlap), ""), position)
+                checked_at = now
+            
+            if recheck:
+                late_changes = get_change_rows(recheck[0], recheck[1], limit - len(changes))
+                if len(late_changes) == limit - len(changes):
+                    recheck = ((late_changes[-1].modified, late_changes[-1].name), recheck[1])
+                    has_more = True
+                else:
+                    recheck = None
+        
+        return {
+            "changes": late_changes + changes,
+            "cursor": encode_change_cursor(position, checked_at, recheck),
+            "has_more": has_more
+        }
+    except Exception as e:
+        frappe.throw(f"Error getting assignment changes: {str(e)}")
+
+def get_change_rows(after, upto, limit):
+    """Merge live assignments and deletion tombstones after one (modified, name) position and up to another, in that order"""
+    values = {"after_modified": after[0], "after_name": after[1], "limit": limit}
+    live_conditions = ["(modified > %(after_modified)s OR (modified = %(after_modified)s AND name > %(after_name)s))"]
+    deleted_conditions = ["(deleted_on > %(after_modified)s OR (deleted_on = %(after_modified)s AND assignment > %(after_name)s))"]
+    if upto:
+        values.update({"upto_modified": upto[0], "upto_name": upto[1]})
+        live_conditions.append("(modified < %(upto_modified)s OR (modified = %(upto_modified)s AND name <= %(upto_name)s))")
+        deleted_conditions.append("(deleted_on < %(upto_modified)s OR (deleted_on = %(upto_modified)s AND assignment <= %(upto_name)s))")
+    
+    # Keyset pagination on the (modified, name) and (deleted_on, assignment) indexes
+    return frappe.db.sql("""
+        SELECT * FROM (
+            (SELECT 
+                name, project, project_name, employee, employee_name, department,
+                start_date, end_date, allocation_percentage, status,
+                docstatus, modified, 0 as deleted, NULL as deletion_reason
+            FROM `tabProject Assignment`
+            WHERE {live_conditions}
+            ORDER BY modified, name
+            LIMIT %(limit)s)
+            UNION ALL
+            (SELECT 
+                assignment, project, NULL, employee, NULL, NULL,
+                NULL, NULL, NULL, NULL,
+                NULL, deleted_on, 1, reason
+            FROM `tabProject Assignment Deletion`
+            WHERE {deleted_conditions}
+            ORDER BY deleted_on, assignment
+            LIMIT %(limit)s)
+        ) changes
+        ORDER BY modified, name
+        LIMIT %(limit)s
+    """.format(
+        live_conditions=" AND ".join(live_conditions),
+        deleted_conditions=" AND ".join(deleted_conditions)
+    ), values, as_dict=True)
+
+def encode_change_cursor(position, checked_at, recheck=None):
+    """Encode the feed position, the earliest unverified read and any verification pass in progress as an opaque cursor"""
+    value = json.dumps([
+        str(position[0]), position[1], str(checked_at),
+        [[str(recheck[0][0]), recheck[0][1]], [str(recheck[1][0]), recheck[1][1]]] if recheck else None
+    ])
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+def decode_change_cursor(cursor):
+    """Decode a cursor into ((modified, name), checked_at, recheck), starting from the beginning when empty"""
+    if not cursor:
+        return (get_datetime("1900-01-01 00:00:00"), ""), None, None
+    
+    try:
+        # Older cursors carry only the position, or no verification pass
+        modified, name, checked_at, recheck, *_ = json.loads(base64.urlsafe_b64decode(cursor.encode())) + [None, None]
+        if recheck:
+            recheck = tuple((get_datetime(row_modified), row_name) for row_modified, row_name in recheck)
+        return (get_datetime(modified), name), get_datetime(checked_at) if checked_at else None, recheck
+    except Exception:
+        frappe.throw("Invalid change cursor")
@@ -0,0 +1,96 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import time
+
+import frappe
+from frappe.utils import add_months, cint, flt, getdate, now_datetime, today
+from rm_ivalue.rm_ivalue.assignment_cache import invalidate_employee_assignments
+from rm_ivalue.rm_ivalue.assignment_deletions import log_assignment_deletions
+from rm_ivalue.rm_ivalue.status_counters import apply_counter_deltas
+
+# Columns copied as-is from Project Assignment to Archived Project Assignment
+ARCHIVED_COLUMNS = [
+    "name", "creation", "modified", "modified_by", "owner", "idx",
+    "project", "project_name", "employee", "employee_name", "department", "status",
+    "start_date", "end_date", "allocation_percentage", "allocation_reference",
+    "working_days", "estimated_total_cost"
+]
+
+def archive_completed_assignments(months=None, batch_size=None, max_batches=None, pause=None):
+    """Move submitted assignments that ended more than N months ago to the archive table in throttled batches.
+
+    Each batch is copied and deleted in its own transaction, so an interrupted
+    run leaves every assignment in exactly one of the two tables."""
+    conf = frappe.conf
+    months = cint(months or conf.get("rm_ivalue_archive_after_months") or 12)
+    batch_size = cint(batch_size or conf.get("rm_ivalue_archive_batch_size") or 500)
+    max_batches = cint(max_batches or conf.get("rm_ivalue_archive_max_batches") or 100)
+    pause = flt(pause if pause is not None else conf.get("rm_ivalue_archive_pause", 1))
+
+    cutoff = add_months(getdate(today()), -months)
+    archived_count = 0
+
+    for batch in range(max_batches):
+        # Served by the (docstatus, end_date) index
+        assignments = frappe.db.sql("""
+            SELECT name, employee
+            FROM `tabProject Assignment`
+            WHERE docstatus = 1
+            AND status = 'Completed'
+            AND end_date < %(cutoff)s
+            ORDER BY end_date
+            LIMIT %(batch_size)s
+        """, {"cutoff": cutoff, "batch_size": batch_size}, as_dict=True)
+
+        if not assignments:
+            break
+
+        archive_assignments([assignment.name for assignment in assignments])
+        invalidate_employee_assignments([assignment.employee for assignment in assignments])
+        apply_counter_deltas({"Completed": [-len(assignments), -len(assignments)]})
+        frappe.db.commit()
+        archived_count += len(assignments)
+
+        if len(assignments) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    if archived_count:
+        frappe.logger("rm_ivalue").info(f"Archived {archived_count} Project Assignments ended before {cutoff}")
+
+    return archived_count
+
+def archive_assignments(names):
+    """Copy assignments to the archive table and delete them from the live table, leaving tombstones for the change feed"""
+    log_assignment_deletions(names, "Archived")
+    columns = ", ".join(f"`{column}`" for column in ARCHIVED_COLUMNS)
+
+    frappe.db.sql(f"""
+        INSERT INTO `tabArchived Project Assignment` ({columns}, `docstatus`, `archived_on`)
+        SELECT {columns}, 0, %(archived_on)s
+        FROM `tabProject Assignment`
+        WHERE name IN %(names)s
+    """, {"names": names, "archived_on": now_datetime()})
+
+    frappe.db.sql("""
+        DELETE FROM `tabProject Assignment`
+        WHERE name IN %(names)s
+    """, {"names": names})
+
+def get_archived_assignments(filters, fields):
+    """Get archived assignments shaped like their submitted live counterparts"""
+    fields = [field for field in fields if field != "docstatus"]
+    assignments = frappe.get_all(
+        "Archived Project Assignment",
+        filters=filters,
+        fields=fields,
+        order_by="start_date asc"
+    )
+
+    for assignment in assignments:
+        assignment.docstatus = 1
+        assignment.archived = 1
+
+    return assignments
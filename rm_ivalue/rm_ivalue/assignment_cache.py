@@ -0,0 +1,92 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import hashlib
+import json
+
+import frappe
+from rm_ivalue.rm_ivalue.realtime import queue_assignment_deltas
+from rm_ivalue.rm_ivalue.replica import hget_cached, is_on_replica, mark_recent_write
+
+EMPLOYEE_INDEX_KEY = "rm_ivalue:employee_assignments"
+ALLOCATION_VERSION_KEY = "rm_ivalue:allocation_version"
+
+INDEX_FIELDS = [
+    "name", "project", "project_name", "employee", "employee_name",
+    "start_date", "end_date", "allocation_percentage", "status",
+    "docstatus", "creation"
+]
+
+def get_employee_assignments(employee):
+    """Get all non-cancelled assignments of an employee ordered by start date, served from Redis"""
+    return hget_cached(
+        EMPLOYEE_INDEX_KEY,
+        employee,
+        lambda: build_employee_index(employee)
+    ) or []
+
+def build_employee_index(employee):
+    """Load the assignment index of an employee from the database"""
+    return frappe.get_all(
+        "Project Assignment",
+        filters={
+            "employee": employee,
+            "docstatus": ["!=", 2]
+        },
+        fields=INDEX_FIELDS,
+        order_by="start_date asc, name asc"
+    )
+
+def invalidate_employee_assignments(employees):
+    """Drop the cached assignment index of the given employees, expire cached allocation results and push dashboard deltas.
+
+    The entries are dropped immediately and once more after commit, so a
+    concurrent reader cannot re-cache the pre-commit rows."""
+    if isinstance(employees, str):
+        employees = [employees]
+
+    employees = {employee for employee in employees if employee}
+    if not employees:
+        return
+
+    def clear():
+        for employee in employees:
+            frappe.cache().hdel(EMPLOYEE_INDEX_KEY, employee)
+        bump_allocation_version()
+
+    clear()
+    frappe.db.after_commit.add(clear)
+    mark_recent_write()
+    queue_assignment_deltas(employees)
+
+def clear_employee_index():
+    """Drop the cached assignment index of every employee"""
+    frappe.cache().delete_value(EMPLOYEE_INDEX_KEY)
+
+def get_allocation_version():
+    """Get the token that changes whenever any assignment changes, for keying cached results"""
+    version = frappe.cache().get_value(ALLOCATION_VERSION_KEY)
+    if not version:
+        version = bump_allocation_version()
+    return version
+
+def bump_allocation_version():
+    """Expire every cached result keyed on the allocation version"""
+    version = frappe.generate_hash(length=10)
+    frappe.cache().set_value(ALLOCATION_VERSION_KEY, version)
+    return version
+
+def get_cached_result(name, filters, generator, expires_in_sec=600):
+    """Get a computed result cached per filter set and allocation version"""
+    key = "rm_ivalue:{0}:{1}:{2}".format(
+        name,
+        get_allocation_version(),
+        hashlib.sha1(json.dumps(filters or {}, sort_keys=True, default=str).encode()).hexdigest()
+    )
+    result = frappe.cache().get_value(key)
+    if result is None:
+        result = generator()
+        # Results computed from the replica may be stale and are not shared
+        if not is_on_replica():
+            frappe.cache().set_value(key, result, expires_in_sec=expires_in_sec)
+    return result
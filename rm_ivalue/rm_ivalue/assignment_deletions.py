@@ -0,0 +1,43 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.utils import add_days, cint, now_datetime
+
+def log_assignment_deletions(names, reason):
+    """Write a tombstone for each assignment about to leave the live table.
+
+    Called in the same transaction as the delete, so the change feed
+    sees either the row or its tombstone, never neither."""
+    if not names:
+        return
+
+    assignments = frappe.db.sql("""
+        SELECT name, employee, project
+        FROM `tabProject Assignment`
+        WHERE name IN %(names)s
+    """, {"names": list(names)}, as_dict=True)
+    insert_deletion_rows(assignments, reason)
+
+def insert_deletion_rows(assignments, reason):
+    if not assignments:
+        return
+
+    now = now_datetime()
+    user = frappe.session.user if getattr(frappe.local, "session", None) else "Administrator"
+    frappe.db.bulk_insert(
+        "Project Assignment Deletion",
+        ["name", "creation", "modified", "owner", "modified_by", "assignment", "employee", "project", "reason", "deleted_on"],
+        [
+            [frappe.generate_hash(length=12), now, now, user, user, assignment.name, assignment.employee, assignment.project, reason, now]
+            for assignment in assignments
+        ]
+    )
+
+def prune_assignment_deletions(days=None):
+    """Drop tombstones older than the retention window; feed consumers must sync more often than that"""
+    days = cint(days or frappe.conf.get("rm_ivalue_deletion_retention_days") or 90)
+    frappe.db.sql("""
+        DELETE FROM `tabProject Assignment Deletion`
+        WHERE deleted_on < %(cutoff)s
+    """, {"cutoff": add_days(now_datetime(), -days)})
@@ -0,0 +1,113 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.utils import add_days, cint, flt, get_datetime, getdate, now_datetime
+
+# valid_to of the current state of an assignment, so as-of lookups are plain range predicates
+OPEN_VALID_TO = "9999-12-31 00:00:00"
+
+# Project Assignment fields captured in each history row
+STATE_FIELDS = ["employee", "project", "start_date", "end_date", "allocation_percentage", "status", "estimated_total_cost"]
+
+def record_assignment_states(assignment_names):
+    """Close the open history row of each assignment and append its current state if it changed"""
+    assignment_names = list({name for name in assignment_names if name})
+    if not assignment_names:
+        return
+
+    assignments = frappe.db.sql("""
+        SELECT name, docstatus, {fields}
+        FROM `tabProject Assignment`
+        WHERE name IN %(names)s
+    """.format(fields=", ".join(STATE_FIELDS)), {"names": assignment_names}, as_dict=True)
+
+    open_states = {
+        row.assignment: row for row in frappe.db.sql("""
+            SELECT assignment, assignment_docstatus, {fields}
+            FROM `tabProject Assignment History`
+            WHERE assignment IN %(names)s
+            AND valid_to = %(open_valid_to)s
+        """.format(fields=", ".join(STATE_FIELDS)), {
+            "names": assignment_names,
+            "open_valid_to": OPEN_VALID_TO
+        }, as_dict=True)
+    }
+
+    changed = []
+    for assignment in assignments:
+        open_state = open_states.get(assignment.name)
+        if not open_state or get_state(open_state, open_state.assignment_docstatus) != get_state(assignment, assignment.docstatus):
+            changed.append(assignment)
+
+    if not changed:
+        return
+
+    now = now_datetime()
+    close_assignment_history([assignment.name for assignment in changed], now)
+    insert_history_rows([
+        (assignment.name, assignment.docstatus, assignment, now, OPEN_VALID_TO)
+        for assignment in changed
+    ])
+
+def close_assignment_history(assignment_names, valid_to=None):
+    """End the open history row of the given assignments"""
+    frappe.db.sql("""
+        UPDATE `tabProject Assignment History`
+        SET valid_to = %(valid_to)s
+        WHERE assignment IN %(names)s
+        AND valid_to = %(open_valid_to)s
+    """, {
+        "names": list(assignment_names),
+        "valid_to": valid_to or now_datetime(),
+        "open_valid_to": OPEN_VALID_TO
+    })
+
+def insert_history_rows(rows):
+    """Bulk insert (assignment, docstatus, state, valid_from, valid_to) history rows"""
+    now = now_datetime()
+    user = frappe.session.user if getattr(frappe.local, "session", None) else "Administrator"
+
+    values = []
+    for assignment, docstatus, state, valid_from, valid_to in rows:
+        values.append(
+            [frappe.generate_hash(length=12), now, now, user, user, assignment, docstatus, valid_from, valid_to]
+            + [state.get(field) for field in STATE_FIELDS]
+        )
+
+    frappe.db.bulk_insert(
+        "Project Assignment History",
+        ["name", "creation", "modified", "owner", "modified_by", "assignment",
+         "assignment_docstatus", "valid_from", "valid_to"] + STATE_FIELDS,
+        values
+    )
+
+def get_state(row, docstatus):
+    """Get a comparable tuple of the tracked values of an assignment"""
+    return (
+        cint(docstatus),
+        row.get("employee"),
+        row.get("project"),
+        str(getdate(row.get("start_date"))) if row.get("start_date") else None,
+        str(getdate(row.get("end_date"))) if row.get("end_date") else None,
+        flt(row.get("allocation_percentage")),
+        row.get("status"),
+        flt(row.get("estimated_total_cost"), 2)
+    )
+
+def get_as_of_cutoff(as_of):
+    """An as-of date means the plan at the end of that day"""
+    return get_datetime(add_days(getdate(as_of), 1))
+
+def get_as_of_assignments_query():
+    """SQL selecting submitted assignment states that were current at %(as_of_cutoff)s, shaped like Project Assignment"""
+    return """
+        SELECT
+            assignment as name, employee, project, start_date, end_date,
+            allocation_percentage, status, estimated_total_cost,
+            assignment_docstatus as docstatus
+        FROM `tabProject Assignment History`
+        WHERE valid_to >= %(as_of_cutoff)s
+        AND valid_from < %(as_of_cutoff)s
+        AND assignment_docstatus = 1
+    """
@@ -0,0 +1,62 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.utils import now_datetime
+
+CHANGE_LOG_FIELDS = [
+    "assignment", "employee", "project", "change_type", "changed_on", "changed_by",
+    "old_end_date", "new_end_date", "effective_date",
+    "old_allocation_percentage", "new_allocation_percentage", "new_assignment", "reason"
+]
+
+def log_assignment_change(**entry):
+    """Queue a change log entry, written together with the others of the transaction just before commit"""
+    entry.setdefault("changed_on", now_datetime())
+    entry.setdefault("changed_by", frappe.session.user)
+
+    pending = frappe.flags.rm_ivalue_change_log
+    if pending is None:
+        pending = frappe.flags.rm_ivalue_change_log = []
+        frappe.db.before_commit.add(flush_change_log)
+        frappe.db.after_rollback.add(discard_change_log)
+
+    pending.append(entry)
+
+def discard_change_log():
+    frappe.flags.rm_ivalue_change_log = None
+
+def flush_change_log():
+    """Bulk insert the queued change log entries"""
+    entries = frappe.flags.rm_ivalue_change_log or []
+    frappe.flags.rm_ivalue_change_log = None
+    insert_change_log_rows(entries)
+
+def insert_change_log_rows(entries):
+    if not entries:
+        return
+
+    now = now_datetime()
+    user = frappe.session.user if getattr(frappe.local, "session", None) else "Administrator"
+    frappe.db.bulk_insert(
+        "Assignment Change Log",
+        ["name", "creation", "modified", "owner", "modified_by"] + CHANGE_LOG_FIELDS,
+        [
+            [frappe.generate_hash(length=12), now, now, user, user]
+            + [entry.get(field) for field in CHANGE_LOG_FIELDS]
+            for entry in entries
+        ]
+    )
+
+def get_change_log(assignment_names):
+    """Get change log entries recorded on, or creating, any of the given assignments, newest first"""
+    return frappe.db.sql("""
+        SELECT {fields}
+        FROM `tabAssignment Change Log`
+        WHERE assignment IN %(names)s
+        UNION
+        SELECT {fields}
+        FROM `tabAssignment Change Log`
+        WHERE new_assignment IN %(names)s
+        ORDER BY changed_on DESC
+    """.format(fields=", ".join(CHANGE_LOG_FIELDS)), {"names": list(assignment_names)}, as_dict=True)
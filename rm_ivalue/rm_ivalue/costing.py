@@ -0,0 +1,254 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+from bisect import bisect_right
+
+import frappe
+from frappe.utils import add_days, cint, flt, getdate
+from rm_ivalue.rm_ivalue.assignment_history import record_assignment_states
+from rm_ivalue.rm_ivalue.replica import is_on_replica, mark_recent_write
+from rm_ivalue.rm_ivalue.utils import parse_list
+from rm_ivalue.rm_ivalue.working_days import (
+    clear_working_day_calendar,
+    count_working_days,
+    get_holiday_lists,
+)
+
+PROJECT_COST_KEY = "rm_ivalue:project_cost"
+
+def get_cost_rates(employees=None, designations=None):
+    """Load the rate history of employees and designations, ordered by effective date"""
+    rates = frappe._dict({"employee": {}, "designation": {}})
+    employees = [employee for employee in employees or [] if employee]
+    designations = [designation for designation in designations or [] if designation]
+    if not employees and not designations:
+        return rates
+
+    rows = frappe.db.sql("""
+        SELECT employee, designation, effective_from, daily_rate
+        FROM `tabEmployee Cost Rate`
+        WHERE employee IN %(employees)s OR designation IN %(designations)s
+        ORDER BY effective_from
+    """, {
+        "employees": employees or [""],
+        "designations": designations or [""]
+    }, as_dict=True)
+
+    for row in rows:
+        if row.employee:
+            rates.employee.setdefault(row.employee, []).append((getdate(row.effective_from), flt(row.daily_rate)))
+        elif row.designation:
+            rates.designation.setdefault(row.designation, []).append((getdate(row.effective_from), flt(row.daily_rate)))
+
+    return rates
+
+def get_rate_on(rate_history, date):
+    """Get the rate in effect on a date from an ordered rate history"""
+    index = bisect_right([effective_from for effective_from, rate in rate_history], date)
+    return rate_history[index - 1][1] if index else None
+
+def calculate_assignment_cost(assignment, designation, rates, holiday_list=None):
+    """Get (working_days, cost) of an assignment as allocation x working days x rate.
+
+    The assignment is split wherever a rate becomes effective, and an
+    employee rate takes precedence over the designation rate."""
+    start_date = getdate(assignment.start_date)
+    end_date = getdate(assignment.end_date)
+    employee_rates = rates.employee.get(assignment.employee, [])
+    designation_rates = rates.designation.get(designation, [])
+
+    breakpoints = sorted({start_date} | {
+        effective_from for effective_from, rate in employee_rates + designation_rates
+        if start_date < effective_from <= end_date
+    })
+
+    cost = 0
+    for index, segment_start in enumerate(breakpoints):
+        segment_end = add_days(breakpoints[index + 1], -1) if index + 1 < len(breakpoints) else end_date
+        rate = get_rate_on(employee_rates, segment_start)
+        if rate is None:
+            rate = get_rate_on(designation_rates, segment_start)
+        if rate:
+            cost += flt(assignment.allocation_percentage) / 100 * count_working_days(segment_start, segment_end, holiday_list) * rate
+
+    return count_working_days(start_date, end_date, holiday_list), flt(cost, 2)
+
+def update_assignment_costs(assignment_names):
+    """Recompute the stored cost of the given assignments"""
+    if not assignment_names:
+        return 0
+    return recompute_costs("pa.name IN %(names)s", {"names": list(assignment_names)})
+
+def update_costs_for_employee(employee):
+    """Recompute the stored cost of all assignments of an employee"""
+    return recompute_costs("pa.employee = %(employee)s", {"employee": employee})
+
+def update_costs_for_rate_change(employee=None, designation=None, effective_from=None):
+    """Recompute the stored cost of assignments affected by a rate becoming effective"""
+    if employee:
+        condition = "pa.employee = %(employee)s"
+    elif designation:
+        condition = "emp.designation = %(designation)s"
+    else:
+        return 0
+
+    return recompute_costs(condition + " AND pa.end_date >= %(effective_from)s", {
+        "employee": employee,
+        "designation": designation,
+        "effective_from": getdate(effective_from)
+    })
+
+def update_costs_for_holiday_list(holiday_list):
+    """Recompute the stored cost of assignments of employees working to a holiday list, directly or through their company"""
+    # The job runs after the change committed, so calendars cached meanwhile are dropped again
+    clear_working_day_calendar()
+    return recompute_costs("""pa.employee IN (
+        SELECT emp_hl.name
+        FROM `tabEmployee` emp_hl
+        LEFT JOIN `tabCompany` company ON company.name = emp_hl.company
+        WHERE COALESCE(NULLIF(emp_hl.holiday_list, ''), company.default_holiday_list) = %(holiday_list)s
+    )""", {"holiday_list": holiday_list})
+
+def update_costs_for_company(company):
+    """Recompute the stored cost of assignments of employees falling back to the company's default holiday list"""
+    return recompute_costs("""pa.employee IN (
+        SELECT emp_hl.name
+        FROM `tabEmployee` emp_hl
+        WHERE emp_hl.company = %(company)s
+        AND COALESCE(emp_hl.holiday_list, '') = ''
+    )""", {"company": company})
+
+def recompute_costs(condition, values):
+    """Recompute costs for matching assignments and write only the ones that changed"""
+    assignments = frappe.db.sql("""
+        SELECT
+            pa.name, pa.employee, pa.project, pa.start_date, pa.end_date,
+            pa.allocation_percentage, pa.working_days, pa.estimated_total_cost,
+            emp.designation
+        FROM `tabProject Assignment` pa
+        LEFT JOIN `tabEmployee` emp ON emp.name = pa.employee
+        WHERE pa.docstatus < 2
+        AND {condition}
+    """.format(condition=condition), values, as_dict=True)
+
+    if not assignments:
+        return 0
+
+    rates = get_cost_rates(
+        {assignment.employee for assignment in assignments},
+        {assignment.designation for assignment in assignments}
+    )
+    holiday_lists = get_holiday_lists([assignment.employee for assignment in assignments])
+
+    updated_names = []
+    changed_projects = set()
+    for assignment in assignments:
+        working_days, cost = calculate_assignment_cost(
+            assignment, assignment.designation, rates, holiday_lists.get(assignment.employee)
+        )
+        if working_days == cint(assignment.working_days) and cost == flt(assignment.estimated_total_cost, 2):
+            continue
+
+        frappe.db.set_value(
+            "Project Assignment",
+            assignment.name,
+            {"working_days": working_days, "estimated_total_cost": cost},
+            update_modified=False
+        )
+        updated_names.append(assignment.name)
+        changed_projects.add(assignment.project)
+
+    invalidate_project_costs(changed_projects)
+    record_assignment_states(updated_names)
+    return len(updated_names)
+
+def get_project_costs(projects):
+    """Get the total cost of submitted assignments per project, cached in Redis"""
+    cache = frappe.cache()
+    costs = {}
+    missing = []
+    for project in set(projects):
+        cost = cache.hget(PROJECT_COST_KEY, project)
+        if cost is None:
+            missing.append(project)
+        else:
+            costs[project] = cost
+
+    if missing:
+        # Archived assignments still count towards the project cost
+        totals = dict(frappe.db.sql("""
+            SELECT project, SUM(cost)
+            FROM (
+                SELECT project, estimated_total_cost as cost
+                FROM `tabProject Assignment`
+                WHERE docstatus = 1
+                AND project IN %(projects)s
+                UNION ALL
+                SELECT project, estimated_total_cost as cost
+                FROM `tabArchived Project Assignment`
+                WHERE project IN %(projects)s
+            ) costs
+            GROUP BY project
+        """, {"projects": missing}))
+
+        for project in missing:
+            costs[project] = flt(totals.get(project))
+            if not is_on_replica():
+                cache.hset(PROJECT_COST_KEY, project, costs[project])
+
+    return costs
+
+def invalidate_project_costs(projects):
+    """Drop cached cost rollups of the given projects, again after commit"""
+    if isinstance(projects, str):
+        projects = [projects]
+
+    projects = {project for project in projects if project}
+    if not projects:
+        return
+
+    def clear():
+        for project in projects:
+            frappe.cache().hdel(PROJECT_COST_KEY, project)
+
+    clear()
+    frappe.db.after_commit.add(clear)
+    mark_recent_write()
+
+@frappe.whitelist()
+def get_project_cost_rollup(projects):
+    """Get the estimated cost of submitted assignments for each project"""
+    if not frappe.has_permission("Project Assignment", "read"):
+        frappe.throw("Not enough permissions to read Project Assignment")
+
+    return get_project_costs(parse_list(projects))
+
+def on_employee_update(doc, method=None):
+    """Designation rates and holiday lists apply through the employee, so changing them reprices their assignments"""
+    if any(doc.has_value_changed(field) for field in ("designation", "holiday_list", "company")):
+        update_costs_for_employee(doc.name)
+
+def on_holiday_list_update(doc, method=None):
+    """Reprice assignments working to the holiday list in the background once the change commits"""
+    frappe.enqueue(
+        "rm_ivalue.rm_ivalue.costing.update_costs_for_holiday_list",
+        queue="long",
+        job_id=f"rm_ivalue_holiday_list_costs::{doc.name}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        holiday_list=doc.name
+    )
+
+def on_company_update(doc, method=None):
+    """Employees without their own holiday list work to the company default, so changing it reprices them"""
+    if not doc.has_value_changed("default_holiday_list"):
+        return
+
+    frappe.enqueue(
+        "rm_ivalue.rm_ivalue.costing.update_costs_for_company",
+        queue="long",
+        job_id=f"rm_ivalue_company_costs::{doc.name}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        company=doc.name
+    )
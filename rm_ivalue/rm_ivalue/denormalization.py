@@ -0,0 +1,116 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.utils import now
+from rm_ivalue.rm_ivalue.assignment_cache import invalidate_employee_assignments
+
+# Source doctype: (link field on the assignment, {source field: assignment field})
+DENORMALIZED_ATTRIBUTES = {
+    "Employee": ("employee", {"employee_name": "employee_name", "department": "department"}),
+    "Project": ("project", {"project_name": "project_name"}),
+}
+
+# Archived rows are read by the reports too, so their copies are kept in sync as well
+ASSIGNMENT_TABLES = ("Project Assignment", "Archived Project Assignment")
+
+SYNC_BATCH_SIZE = 500
+
+def on_employee_update(doc, method=None):
+    queue_attribute_sync("Employee", doc)
+
+def on_project_update(doc, method=None):
+    queue_attribute_sync("Project", doc)
+
+def queue_attribute_sync(source_doctype, doc):
+    """Queue the source document for propagation when a denormalized attribute changed.
+
+    Sources changed in one transaction are propagated together just before
+    it commits, so a bulk edit of employees costs a few batched UPDATEs."""
+    link_field, fields = DENORMALIZED_ATTRIBUTES[source_doctype]
+    if not any(doc.has_value_changed(field) for field in fields):
+        return
+
+    pending = frappe.flags.rm_ivalue_attribute_sync
+    if pending is None:
+        pending = frappe.flags.rm_ivalue_attribute_sync = {}
+        frappe.db.before_commit.add(flush_attribute_sync)
+        frappe.db.after_rollback.add(discard_attribute_sync)
+
+    pending.setdefault(source_doctype, set()).add(doc.name)
+
+def discard_attribute_sync():
+    frappe.flags.rm_ivalue_attribute_sync = None
+
+def flush_attribute_sync():
+    pending = frappe.flags.rm_ivalue_attribute_sync or {}
+    frappe.flags.rm_ivalue_attribute_sync = None
+    for source_doctype, names in pending.items():
+        sync_denormalized_attributes(source_doctype, names)
+
+def sync_denormalized_attributes(source_doctype, names):
+    """Copy the current attributes of the given source documents to the assignments whose copies differ.
+
+    Live assignments get a new modified timestamp, so change feed consumers
+    receive renames and department moves; a burst shares one timestamp and
+    is paged by name. Returns the number of assignment rows updated."""
+    link_field, fields = DENORMALIZED_ATTRIBUTES[source_doctype]
+    names = sorted(name for name in names if name)
+    mismatch = get_mismatch_condition(fields)
+    assignments = ", ".join(f"pa.`{target}` = src.`{source}`" for source, target in fields.items())
+
+    updated_count = 0
+    for start in range(0, len(names), SYNC_BATCH_SIZE):
+        batch = names[start:start + SYNC_BATCH_SIZE]
+        for doctype in ASSIGNMENT_TABLES:
+            stale = frappe.db.sql(f"""
+                SELECT pa.name, pa.employee
+                FROM `tab{doctype}` pa
+                INNER JOIN `tab{source_doctype}` src ON src.name = pa.`{link_field}`
+                WHERE pa.`{link_field}` IN %(names)s
+                AND ({mismatch})
+            """, {"names": batch}, as_dict=True)
+
+            if not stale:
+                continue
+
+            # Archived rows have left the change feed, so only live rows are re-stamped
+            modified = ", pa.modified = %(modified)s" if doctype == "Project Assignment" else ""
+            frappe.db.sql(f"""
+                UPDATE `tab{doctype}` pa
+                INNER JOIN `tab{source_doctype}` src ON src.name = pa.`{link_field}`
+                SET {assignments}{modified}
+                WHERE pa.name IN %(names)s
+            """, {"names": [row.name for row in stale], "modified": now()})
+
+            updated_count += len(stale)
+            if doctype == "Project Assignment":
+                # The cached employee index and open dashboards carry the names
+                invalidate_employee_assignments([row.employee for row in stale])
+
+    return updated_count
+
+def repair_denormalized_attributes():
+    """Nightly consistency repair for copies missed by the update hooks, e.g. direct database writes"""
+    repaired = {}
+    for source_doctype, (link_field, fields) in DENORMALIZED_ATTRIBUTES.items():
+        mismatch = get_mismatch_condition(fields)
+        names = set()
+        for doctype in ASSIGNMENT_TABLES:
+            names.update(frappe.db.sql_list(f"""
+                SELECT DISTINCT pa.`{link_field}`
+                FROM `tab{doctype}` pa
+                INNER JOIN `tab{source_doctype}` src ON src.name = pa.`{link_field}`
+                WHERE {mismatch}
+            """))
+
+        repaired[source_doctype] = sync_denormalized_attributes(source_doctype, names)
+
+    if any(repaired.values()):
+        frappe.logger("rm_ivalue").info({"denormalization_repair": repaired})
+
+    return sum(repaired.values())
+
+def get_mismatch_condition(fields):
+    """SQL matching assignments (pa) whose copies differ from the source (src), NULLs included"""
+    return " OR ".join(f"NOT (pa.`{target}` <=> src.`{source}`)" for source, target in fields.items())
@@ -0,0 +1,8 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+from frappe.model.document import Document
+
+class ArchivedProjectAssignment(Document):
+    """Completed Project Assignment moved out of the live table by the archival job"""
+    pass
@@ -0,0 +1,14 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+class AssignmentChangeLog(Document):
+    """Written by rm_ivalue.rm_ivalue.change_log, never edited by hand"""
+    pass
+
+def on_doctype_update():
+    frappe.db.add_index("Assignment Change Log", ["assignment", "changed_on"])
+    frappe.db.add_index("Assignment Change Log", ["employee", "changed_on"])
+    frappe.db.add_index("Assignment Change Log", ["new_assignment"])
@@ -0,0 +1,35 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from rm_ivalue.rm_ivalue.costing import update_costs_for_rate_change
+
+class EmployeeCostRate(Document):
+    def validate(self):
+        self.validate_rate_target()
+        
+    def validate_rate_target(self):
+        # A rate applies either to one employee or to a whole designation
+        if not self.employee and not self.designation:
+            frappe.throw("Either Employee or Designation is required")
+        if self.employee and self.designation:
+            frappe.throw("Set either Employee or Designation, not both")
+    
+    def on_update(self):
+        """Reprice assignments affected by this rate and by its previous values"""
+        doc_before_save = self.get_doc_before_save()
+        if doc_before_save and (
+            doc_before_save.employee != self.employee
+            or doc_before_save.designation != self.designation
+            or doc_before_save.effective_from != self.effective_from
+        ):
+            update_costs_for_rate_change(
+                doc_before_save.employee, doc_before_save.designation, doc_before_save.effective_from
+            )
+        
+        update_costs_for_rate_change(self.employee, self.designation, self.effective_from)
+    
+    def after_delete(self):
+        """Reprice assignments that used this rate"""
+        update_costs_for_rate_change(self.employee, self.designation, self.effective_from)
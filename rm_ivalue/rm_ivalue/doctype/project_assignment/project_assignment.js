@@ -70,25 +70,23 @@ function update_duration_info(frm) {
 
 function add_progress_indicators(frm) {
     if (frm.doc.docstatus === 1 && frm.doc.status === 'Active') {
+        // Working-day progress, computed on the server from the employee's holiday list
         frappe.call({
-            method: 'frappe.client.get',
+            method: 'rm_ivalue.rm_ivalue.api.get_assignment_metrics',
             args: {
-                doctype: 'Project Assignment',
-                name: frm.doc.name
+                names: [frm.doc.name]
             },
             callback: function(r) {
-                if (r.message) {
-                    let today = frappe.datetime.get_today();
-                    let start_date = r.message.start_date;
-                    let end_date = r.message.end_date;
+                let values = r.message && r.message.metrics[frm.doc.name];
+                if (values) {
+                    let metrics = {};
+                    r.message.fields.forEach((field, index) => metrics[field] = values[index]);
                     
-                    let total_days = frappe.datetime.get_diff(end_date, start_date) + 1;
-                    let elapsed_days = Math.max(0, frappe.datetime.get_diff(today, start_date) + 1);
-                    let progress = Math.min(100, (elapsed_days / total_days) * 100);
-                    
-                    let remaining_days = Math.max(0, frappe.datetime.get_diff(end_date, today));
-                    
-                    frm.dashboard.add_progress(__('Time Progress'), progress, __(`${remaining_days} days remaining`));
+                    frm.dashboard.add_progress(
+                        __('Time Progress'),
+                        metrics.progress_percentage,
+                        __(`${metrics.remaining_days} working days remaining`)
+                    );
                 }
             }
         });
@@ -172,7 +170,8 @@ function show_end_date_change_dialog(frm) {
                 args: {
                     assignment_name: frm.doc.name,
                     new_end_date: values.new_end_date,
-                    reason: values.reason
+                    reason: values.reason,
+                    modified: frm.doc.modified
                 },
                 callback: function(r) {
                     if (r.message && r.message.success) {
@@ -233,7 +232,8 @@ function show_allocation_change_dialog(frm) {
                     assignment_name: frm.doc.name,
                     new_allocation_percentage: values.new_allocation_percentage,
                     effective_date: values.effective_date,
-                    reason: values.reason
+                    reason: values.reason,
+                    modified: frm.doc.modified
                 },
                 callback: function(r) {
                     if (r.message && r.message.success) {
@@ -293,13 +293,13 @@ function show_change_history(frm) {
                     history_html += '</tbody></table>';
                 }
                 
-                // Show comments/changes
-                if (r.message.comments && r.message.comments.length > 0) {
+                // Show the change log
+                if (r.message.changes && r.message.changes.length > 0) {
                     history_html += '<h5 class="mt-3">Change Log</h5>';
-                    r.message.comments.forEach(function(comment) {
+                    r.message.changes.forEach(function(change) {
                         history_html += `<div class="alert alert-secondary">
-                            <small class="text-muted">${frappe.datetime.str_to_user(comment.creation)} by ${comment.owner}</small><br>
-                            ${comment.content}
+                            <small class="text-muted">${frappe.datetime.str_to_user(change.changed_on)} by ${change.changed_by}</small><br>
+                            ${get_change_description(change)}
                         </div>`;
                     });
                 }
@@ -316,6 +316,30 @@ function show_change_history(frm) {
     });
 }
 
+function get_change_description(change) {
+    let description;
+    if (change.change_type === 'Allocation') {
+        description = __('Allocation of {0} changed from {1}% to {2}% effective {3}. New assignment: {4}', [
+            change.assignment,
+            change.old_allocation_percentage,
+            change.new_allocation_percentage,
+            frappe.datetime.str_to_user(change.effective_date),
+            change.new_assignment
+        ]);
+    } else {
+        description = __('End date of {0} changed from {1} to {2}', [
+            change.assignment,
+            frappe.datetime.str_to_user(change.old_end_date),
+            frappe.datetime.str_to_user(change.new_end_date)
+        ]);
+    }
+    
+    if (change.reason) {
+        description += '<br>' + __('Reason: {0}', [frappe.utils.escape_html(change.reason)]);
+    }
+    return description;
+}
+
 function get_status_color(status) {
     switch(status) {
         case 'Planned': return 'blue';
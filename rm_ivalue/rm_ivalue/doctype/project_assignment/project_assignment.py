@@ -1,14 +1,59 @@
 # Copyright (c) 2023, Yazan Hamdan and contributors
 # For license information, please see license.txt
 
+import functools
+import random
+import time
+
 import frappe
 from frappe.model.document import Document
-from frappe.utils import date_diff, flt, getdate, today, add_days
+from frappe.utils import date_diff, flt, get_datetime, getdate, now, today, add_days
+from rm_ivalue.rm_ivalue.allocation import get_daily_allocation_profile, get_overlap_days
+from rm_ivalue.rm_ivalue.assignment_cache import invalidate_employee_assignments
+from rm_ivalue.rm_ivalue.assignment_deletions import insert_deletion_rows, log_assignment_deletions
+from rm_ivalue.rm_ivalue.assignment_history import (
+    close_assignment_history,
+    get_as_of_assignments_query,
+    get_as_of_cutoff,
+    record_assignment_states,
+)
+from rm_ivalue.rm_ivalue.change_log import log_assignment_change
+from rm_ivalue.rm_ivalue.costing import (
+    calculate_assignment_cost,
+    get_cost_rates,
+    invalidate_project_costs,
+)
+from rm_ivalue.rm_ivalue.status_counters import update_counters
+from rm_ivalue.rm_ivalue.working_days import get_assignment_day_counts, get_holiday_lists
+
+# Seconds a change request waits for the row lock before giving up, and how often it retries
+CHANGE_REQUEST_LOCK_WAIT = 5
+CHANGE_REQUEST_RETRIES = 3
+
+def retry_on_lock_contention(fn):
+    """Retry a change request a few times when its row lock times out or deadlocks.
+
+    Only a change request that opened the transaction is retried, since the
+    rollback would also undo earlier writes of the request."""
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        for attempt in range(CHANGE_REQUEST_RETRIES):
+            retryable = not frappe.db.transaction_writes
+            try:
+                return fn(self, *args, **kwargs)
+            except (frappe.QueryDeadlockError, frappe.QueryTimeoutError):
+                if not retryable or attempt == CHANGE_REQUEST_RETRIES - 1:
+                    raise
+                frappe.db.rollback()
+                time.sleep(0.05 * (attempt + 1) + random.random() * 0.05)
+    
+    return wrapper
 
 class ProjectAssignment(Document):
     def validate(self):
         self.validate_dates()
         self.validate_allocation_percentage()
+        self.set_estimated_cost()
         
     def validate_dates(self):
         # Check if end date is after start date
@@ -20,15 +65,59 @@ class ProjectAssignment(Document):
         if self.allocation_percentage and (self.allocation_percentage < 0 or self.allocation_percentage > 100):
             frappe.throw("Allocation Percentage must be between 0% and 100%")
     
+    def set_estimated_cost(self):
+        """Set working days and estimated cost from the applicable cost rates"""
+        if not (self.employee and self.start_date and self.end_date):
+            return
+        
+        designation = frappe.db.get_value("Employee", self.employee, "designation")
+        rates = get_cost_rates([self.employee], [designation])
+        self.working_days, self.estimated_total_cost = calculate_assignment_cost(
+            self, designation, rates, self.get_holiday_list()
+        )
+    
     def before_save(self):
         """Update status before saving if not submitted"""
         if self.docstatus == 0:  # Draft
             self.update_status_based_on_dates()
     
-    def on_submit(self):
-        """Update status after submit based on dates"""
+    def before_submit(self):
+        """Update status before submit based on dates, so the submitted row carries it"""
         self.update_status_based_on_dates()
     
+    def on_change(self):
+        """Invalidate caches, move status counters and record history after save, submit, cancel or update after submit"""
+        if self.flags.in_delete:
+            # delete_doc calls on_change after on_trash, which already did all of this
+            return
+        
+        employees = [self.employee]
+        projects = [self.project]
+        doc_before_save = self.get_doc_before_save()
+        if doc_before_save:
+            employees.append(doc_before_save.employee)
+            projects.append(doc_before_save.project)
+        invalidate_employee_assignments(employees)
+        invalidate_project_costs(projects)
+        
+        update_counters(
+            (doc_before_save.status, doc_before_save.docstatus) if doc_before_save else None,
+            (self.status, self.docstatus)
+        )
+        record_assignment_states([self.name])
+    
+    def on_trash(self):
+        """Invalidate cached assignment index and counters, close history and leave a change feed tombstone when a draft is deleted"""
+        invalidate_employee_assignments(self.employee)
+        update_counters((self.status, self.docstatus), None)
+        close_assignment_history([self.name])
+        log_assignment_deletions([self.name], "Deleted")
+    
+    def after_rename(self, old_name, new_name, merge=False):
+        """Invalidate cached assignment index so it does not keep the old name, and retire the old name in the change feed"""
+        invalidate_employee_assignments(self.employee)
+        insert_deletion_rows([frappe._dict(name=old_name, employee=self.employee, project=self.project)], "Renamed")
+    
     def update_status_based_on_dates(self):
         """Update status based on current date and assignment dates"""
         today_date = getdate(today())
@@ -47,45 +136,36 @@ class ProjectAssignment(Document):
         today_date = getdate(today())
         return (getdate(self.start_date) <= today_date <= getdate(self.end_date))
     
+    def get_holiday_list(self):
+        """Get the holiday list that defines working days for this assignment"""
+        if not hasattr(self, "_holiday_list"):
+            self._holiday_list = get_holiday_lists([self.employee]).get(self.employee)
+        return self._holiday_list
+    
+    def get_day_counts(self):
+        """Get total, elapsed and remaining working days of this assignment"""
+        return get_assignment_day_counts(self.start_date, self.end_date, self.get_holiday_list())
+    
     def get_remaining_days(self):
-        """Get remaining days in this assignment"""
-        today_date = getdate(today())
-        if today_date > getdate(self.end_date):
-            return 0
-        elif today_date < getdate(self.start_date):
-            return date_diff(self.end_date, self.start_date) + 1
-        else:
-            return date_diff(self.end_date, today_date)
+        """Get remaining working days in this assignment"""
+        return self.get_day_counts()["remaining_days"]
     
     def get_total_days(self):
-        """Get total days in this assignment"""
-        return date_diff(self.end_date, self.start_date) + 1
+        """Get total working days in this assignment"""
+        return self.get_day_counts()["total_days"]
     
     def get_elapsed_days(self):
-        """Get elapsed days since assignment started"""
-        today_date = getdate(today())
-        start_date = getdate(self.start_date)
-        
-        if today_date < start_date:
-            return 0
-        elif today_date > getdate(self.end_date):
-            return self.get_total_days()
-        else:
-            return date_diff(today_date, self.start_date) + 1
+        """Get elapsed working days since assignment started"""
+        return self.get_day_counts()["elapsed_days"]
     
     def get_progress_percentage(self):
-        """Get progress percentage based on elapsed time"""
-        total_days = self.get_total_days()
-        elapsed_days = self.get_elapsed_days()
-        
-        if total_days <= 0:
-            return 0
-        
-        progress = (elapsed_days / total_days) * 100
-        return min(100, max(0, progress))
+        """Get progress percentage based on elapsed working days"""
+        return self.get_day_counts()["progress_percentage"]
 
-    def create_change_request_for_end_date(self, new_end_date, reason=""):
+    @retry_on_lock_contention
+    def create_change_request_for_end_date(self, new_end_date, reason="", expected_modified=None):
         """Create change request for end date modification"""
+        self.lock_for_change_request(expected_modified)
         if self.docstatus != 1:
             frappe.throw("Can only create change requests for submitted assignments")
         
@@ -94,18 +174,30 @@ class ProjectAssignment(Document):
             frappe.throw("New end date must be after start date")
         
         # Update current document's end date
-        frappe.db.set_value("Project Assignment", self.name, "end_date", new_end_date)
-        frappe.db.set_value("Project Assignment", self.name, "allocation_reference", 
-                           f"End date changed from {self.end_date} to {new_end_date}. Reason: {reason}")
+        original_end_date = self.end_date
+        self.write_change_request({
+            "end_date": getdate(new_end_date),
+            "allocation_reference": f"End date changed from {original_end_date} to {new_end_date}. Reason: {reason}"
+        })
         
         # Log the change
-        self.add_comment("Info", f"End date changed from {self.end_date} to {new_end_date}. Reason: {reason}")
+        log_assignment_change(
+            assignment=self.name,
+            employee=self.employee,
+            project=self.project,
+            change_type="End Date",
+            old_end_date=original_end_date,
+            new_end_date=getdate(new_end_date),
+            reason=reason
+        )
         
         frappe.msgprint(f"End date successfully updated to {new_end_date}")
         return True
 
-    def create_change_request_for_allocation(self, new_allocation_percentage, effective_date, reason=""):
+    @retry_on_lock_contention
+    def create_change_request_for_allocation(self, new_allocation_percentage, effective_date, reason="", expected_modified=None):
         """Create change request for allocation percentage modification"""
+        self.lock_for_change_request(expected_modified)
         if self.docstatus != 1:
             frappe.throw("Can only create change requests for submitted assignments")
         
@@ -125,62 +217,159 @@ class ProjectAssignment(Document):
         original_end_date = self.end_date
         
         # Update current document - set end date to effective_date - 1
-        new_end_date_for_current = add_days(effective_date, -1)
-        frappe.db.set_value("Project Assignment", self.name, "end_date", new_end_date_for_current)
-        frappe.db.set_value("Project Assignment", self.name, "allocation_reference", 
-                           f"Allocation changed from {self.allocation_percentage}% to {new_allocation_percentage}% effective {effective_date}. Reason: {reason}")
+        self.write_change_request({
+            "end_date": add_days(effective_date, -1),
+            "allocation_reference": f"Allocation changed from {self.allocation_percentage}% to {new_allocation_percentage}% effective {effective_date}. Reason: {reason}"
+        })
         
-        # Create new assignment with new allocation
+        # Create new assignment with new allocation, inserted directly as submitted
         new_assignment = frappe.get_doc({
             "doctype": "Project Assignment",
             "project": self.project,
             "project_name": self.project_name,
             "employee": self.employee,
             "employee_name": self.employee_name,
+            "department": self.department,
             "start_date": effective_date,
             "end_date": original_end_date,
             "allocation_percentage": new_allocation_percentage,
             "status": "Planned",  # Will be updated based on dates
-            "allocation_reference": f"Created from CR of {self.name}. New allocation: {new_allocation_percentage}%. Reason: {reason}"
+            "allocation_reference": f"Created from CR of {self.name}. New allocation: {new_allocation_percentage}%. Reason: {reason}",
+            "docstatus": 1
         })
         
         new_assignment.insert()
-        new_assignment.submit()
         
-        # Add comments to both documents
-        self.add_comment("Info", f"Allocation changed from {self.allocation_percentage}% to {new_allocation_percentage}% effective {effective_date}. New assignment created: {new_assignment.name}")
-        new_assignment.add_comment("Info", f"Created from change request of {self.name}")
+        # Log the change, linking both documents
+        log_assignment_change(
+            assignment=self.name,
+            employee=self.employee,
+            project=self.project,
+            change_type="Allocation",
+            old_end_date=original_end_date,
+            new_end_date=self.end_date,
+            effective_date=effective_date,
+            old_allocation_percentage=self.allocation_percentage,
+            new_allocation_percentage=new_allocation_percentage,
+            new_assignment=new_assignment.name,
+            reason=reason
+        )
         
         frappe.msgprint(f"Allocation change processed successfully. New assignment created: {new_assignment.name}")
         return new_assignment.name
+    
+    def lock_for_change_request(self, expected_modified=None):
+        """Lock the assignment row and load its latest committed values into this document.
+
+        Values must come from the locking read itself: a plain read after it
+        would still see the transaction's older snapshot."""
+        row = frappe.db.sql("""
+            SELECT docstatus, modified, employee, employee_name, department, project, project_name,
+                start_date, end_date, allocation_percentage
+            FROM `tabProject Assignment`
+            WHERE name = %(name)s
+            FOR UPDATE WAIT {lock_wait}
+        """.format(lock_wait=CHANGE_REQUEST_LOCK_WAIT), {"name": self.name}, as_dict=True)
+        
+        if not row:
+            frappe.throw(f"Project Assignment {self.name} not found", frappe.DoesNotExistError)
+        
+        if expected_modified and get_datetime(expected_modified) != get_datetime(row[0].modified):
+            frappe.throw(
+                "Project Assignment has been modified after you opened it. Please reload and try again.",
+                frappe.TimestampMismatchError
+            )
+        
+        self.update(row[0])
+    
+    def write_change_request(self, values):
+        """Write change request values and the recalculated cost in a single UPDATE"""
+        self.update(values)
+        self.set_estimated_cost()
+        values.update({
+            "working_days": self.working_days,
+            "estimated_total_cost": self.estimated_total_cost
+        })
+        self.modified = now()
+        frappe.db.set_value("Project Assignment", self.name, values, modified=self.modified)
+        
+        record_assignment_states([self.name])
+        invalidate_employee_assignments(self.employee)
+        invalidate_project_costs(self.project)
 
 # Utility functions for API calls
 def get_employee_workload(employee, start_date=None, end_date=None):
-    """Calculate total workload for an employee in a given period"""
-    filters = {
-        "employee": employee,
-        "docstatus": 1,
-        "status": ["in", ["Planned", "Active"]]
-    }
-    
-    if start_date:
-        filters["start_date"] = [">=", start_date]
-    if end_date:
-        filters["end_date"] = ["<=", end_date]
-    
-    assignments = frappe.get_all(
-        "Project Assignment",
-        filters=filters,
-        fields=["allocation_percentage", "start_date", "end_date"]
-    )
-    
-    # Calculate overlapping periods and total allocation
-    # This is a simplified calculation - for more complex scenarios,
-    # you might need to handle overlapping date ranges more precisely
-    total_allocation = sum([assignment.allocation_percentage for assignment in assignments])
-    
-    return {
-        "total_assignments": len(assignments),
-        "total_allocation": total_allocation,
-        "is_overallocated": total_allocation > 100
-    }
+    """Calculate workload for an employee over a window"""
+    return get_team_workload([employee], start_date, end_date)[employee]
+
+def get_team_workload(employees, start_date=None, end_date=None, as_of=None):
+    """Calculate workload for several employees over a window in one query.
+
+    Every submitted assignment that intersects the window is counted, but only
+    for the days it overlaps. The window defaults to the next 30 days. With
+    as_of, the plan as it stood at the end of that date is used instead."""
+    window_start = getdate(start_date or today())
+    window_end = getdate(end_date) if end_date else add_days(window_start, 29)
+    if window_end < window_start:
+        frappe.throw("End Date cannot be before Start Date")
+    
+    window_days = date_diff(window_end, window_start) + 1
+    employees = list(dict.fromkeys(employees))
+    
+    # Range predicate on the (employee, docstatus, start_date) index, or on
+    # the (employee, valid_to, valid_from) history index for as-of reads
+    source = "({0}) pa".format(get_as_of_assignments_query()) if as_of else "`tabProject Assignment` pa"
+    
+    employee_assignments = {employee: [] for employee in employees}
+    if employees:
+        assignments = frappe.db.sql("""
+            SELECT employee, name, project, allocation_percentage, start_date, end_date
+            FROM {source}
+            WHERE employee IN %(employees)s
+            AND docstatus = 1
+            AND start_date <= %(window_end)s
+            AND end_date >= %(window_start)s
+            ORDER BY employee, start_date
+        """.format(source=source), {
+            "employees": employees,
+            "window_start": window_start,
+            "window_end": window_end,
+            "as_of_cutoff": get_as_of_cutoff(as_of) if as_of else None
+        }, as_dict=True)
+        
+        for assignment in assignments:
+            employee_assignments[assignment.employee].append(assignment)
+    
+    workload = {}
+    for employee, assignments in employee_assignments.items():
+        profile = get_daily_allocation_profile(assignments, window_start, window_end)
+        person_days = sum(
+            flt(assignment.allocation_percentage) / 100
+            * get_overlap_days(assignment.start_date, assignment.end_date, window_start, window_end)
+            for assignment in assignments
+        )
+        peak_allocation = max(profile) if profile else 0
+        
+        workload[employee] = {
+            "employee": employee,
+            "window_start": window_start,
+            "window_end": window_end,
+            "window_days": window_days,
+            "total_assignments": len(assignments),
+            "person_days": flt(person_days, 2),
+            "effective_fte": flt(person_days / window_days, 3),
+            "total_allocation": peak_allocation,
+            "overallocated_days": len([day for day in profile if day > 100]),
+            "is_overallocated": peak_allocation > 100,
+            "daily_profile": profile,
+            "as_of": getdate(as_of) if as_of else None
+        }
+    
+    return workload
+
+def on_doctype_update():
+    frappe.db.add_index("Project Assignment", ["employee", "docstatus", "start_date"])
+    frappe.db.add_index("Project Assignment", ["docstatus", "end_date"])
+    frappe.db.add_index("Project Assignment", ["modified", "name"])
+    frappe.db.add_index("Project Assignment", ["department", "docstatus", "start_date"])
+    frappe.db.add_index("Project Assignment", ["project", "docstatus", "start_date"])
@@ -0,0 +1,57 @@
+// Copyright (c) 2023, Yazan Hamdan and contributors
+// For license information, please see license.txt
+
+frappe.listview_settings['Project Assignment'] = {
+    // Working-day metrics of the rows on the current page, keyed by assignment name
+    metrics: {},
+
+    refresh: function(listview) {
+        let settings = frappe.listview_settings['Project Assignment'];
+        let names = listview.data.map(doc => doc.name);
+        if (!names.length) {
+            return;
+        }
+
+        // One request per page instead of a document load per row
+        frappe.call({
+            method: 'rm_ivalue.rm_ivalue.api.get_assignment_metrics',
+            args: {
+                names: names
+            },
+            callback: function(r) {
+                if (!r.message) {
+                    return;
+                }
+
+                settings.metrics = {};
+                Object.entries(r.message.metrics).forEach(([name, values]) => {
+                    let metrics = {};
+                    r.message.fields.forEach((field, index) => metrics[field] = values[index]);
+                    settings.metrics[name] = metrics;
+                });
+                listview.render_list();
+            }
+        });
+    },
+
+    formatters: {
+        status: function(value, df, doc) {
+            let metrics = frappe.listview_settings['Project Assignment'].metrics[doc.name];
+            if (!metrics || value !== 'Active') {
+                return value;
+            }
+
+            return `${value} <span class="text-muted">(${Math.round(metrics.progress_percentage)}%)</span>`;
+        },
+
+        end_date: function(value, df, doc) {
+            let formatted = frappe.datetime.str_to_user(value);
+            let metrics = frappe.listview_settings['Project Assignment'].metrics[doc.name];
+            if (!metrics || !metrics.remaining_days) {
+                return formatted;
+            }
+
+            return `${formatted} <span class="text-muted">(${__('{0}d left', [metrics.remaining_days])})</span>`;
+        }
+    }
+};
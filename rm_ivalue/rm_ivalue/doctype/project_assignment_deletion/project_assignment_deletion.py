@@ -0,0 +1,12 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+class ProjectAssignmentDeletion(Document):
+    """Tombstone of a Project Assignment deleted or archived, written by rm_ivalue.rm_ivalue.assignment_deletions"""
+    pass
+
+def on_doctype_update():
+    frappe.db.add_index("Project Assignment Deletion", ["deleted_on", "assignment"])
@@ -0,0 +1,14 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+class ProjectAssignmentHistory(Document):
+    """Written by rm_ivalue.rm_ivalue.assignment_history, never edited by hand"""
+    pass
+
+def on_doctype_update():
+    frappe.db.add_index("Project Assignment History", ["assignment", "valid_to"])
+    frappe.db.add_index("Project Assignment History", ["employee", "valid_to", "valid_from"])
+    frappe.db.add_index("Project Assignment History", ["valid_to", "valid_from"])
@@ -0,0 +1,8 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+from frappe.model.document import Document
+
+class ProjectAssignmentStatusCounter(Document):
+    """Maintained by rm_ivalue.rm_ivalue.status_counters, never edited by hand"""
+    pass
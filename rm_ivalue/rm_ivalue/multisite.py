@@ -0,0 +1,145 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import frappe
+from frappe.utils import cint
+
+def run_daily_for_bench():
+    """Scheduler mode: run the daily maintenance of every site of the bench from the coordinator site"""
+    sites_path = os.path.abspath(frappe.local.sites_path)
+    summary = run_daily_for_sites(frappe.utils.get_sites(sites_path), sites_path, respect_scheduler=True)
+    frappe.logger("rm_ivalue").info({"multisite_daily": get_summary_totals(summary)})
+
+    for result in summary["results"]:
+        if result["status"] == "failed":
+            frappe.logger("rm_ivalue").error(f"Daily maintenance failed for {result['site']}: {result['error']}")
+
+    return summary
+
+def run_daily_for_sites(sites, sites_path, processes=None, per_db_host=None, retries=None, respect_scheduler=False):
+    """Run the daily maintenance of many sites in a bounded process pool.
+
+    At most per_db_host sites sharing a database server run at once. Sites
+    that fail are retried on their own; sites that succeeded are not rerun."""
+    conf = frappe.get_conf()
+    processes = max(cint(processes or conf.get("rm_ivalue_daily_processes") or min(4, os.cpu_count() or 1)), 1)
+    per_db_host = max(cint(per_db_host or conf.get("rm_ivalue_daily_per_db_host") or 2), 1)
+    retries = cint(retries if retries is not None else conf.get("rm_ivalue_daily_retries", 1))
+
+    started = time.monotonic()
+    db_hosts = {site: get_db_host(site, sites_path) for site in sites}
+    results = {}
+    pending = list(sites)
+
+    for attempt in range(retries + 1):
+        if not pending:
+            break
+
+        # A fresh pool per round, so a crashed worker cannot break the retries
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+            for result in run_round(executor, pending, db_hosts, processes, per_db_host, sites_path, respect_scheduler):
+                result["attempts"] = attempt + 1
+                results[result["site"]] = result
+
+        pending = [site for site in pending if results[site]["status"] == "failed"]
+
+    return {
+        "seconds": round(time.monotonic() - started, 2),
+        "processes": processes,
+        "per_db_host": per_db_host,
+        "results": sorted(results.values(), key=lambda result: result["site"])
+    }
+
+def run_round(executor, sites, db_hosts, processes, per_db_host, sites_path, respect_scheduler):
+    """Yield site results as they finish, keeping every database server under its concurrency limit"""
+    queued = {}
+    for site in sites:
+        queued.setdefault(db_hosts[site], deque()).append(site)
+
+    running = {}
+    active = {}
+    while queued or running:
+        for db_host in list(queued):
+            while queued[db_host] and active.get(db_host, 0) < per_db_host and len(running) < processes:
+                site = queued[db_host].popleft()
+                future = executor.submit(run_site, site, sites_path, respect_scheduler)
+                running[future] = (site, db_host)
+                active[db_host] = active.get(db_host, 0) + 1
+            if not queued[db_host]:
+                del queued[db_host]
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            site, db_host = running.pop(future)
+            active[db_host] -= 1
+            try:
+                yield future.result()
+            except Exception as e:
+                # The worker process itself died
+                yield get_site_result(site, "failed", error=repr(e))
+
+def run_site(site, sites_path, respect_scheduler=False):
+    """Run the daily maintenance of one site inside a pool worker"""
+    from frappe.utils.scheduler import is_scheduler_inactive
+    from rm_ivalue.rm_ivalue.tasks import run_daily_maintenance
+
+    started = time.monotonic()
+    try:
+        frappe.init(site=site, sites_path=sites_path)
+        frappe.connect()
+
+        if "rm_ivalue" not in frappe.get_installed_apps():
+            result = get_site_result(site, "skipped", error="rm_ivalue is not installed")
+        elif respect_scheduler and is_scheduler_inactive():
+            result = get_site_result(site, "skipped", error="Scheduler is inactive")
+        else:
+            result = get_site_result(site, "ok", **run_daily_maintenance())
+    except Exception as e:
+        result = get_site_result(site, "failed", error=str(e) or repr(e))
+        if getattr(frappe.local, "site", None):
+            frappe.logger("rm_ivalue").exception(f"Daily maintenance failed for {site}")
+    finally:
+        frappe.destroy()
+
+    result["seconds"] = round(time.monotonic() - started, 2)
+    return result
+
+def get_site_result(site, status, updated=0, drift=0, repaired=0, error=None):
+    return {
+        "site": site,
+        "status": status,
+        "updated": updated,
+        "drift": drift,
+        "repaired": repaired,
+        "error": error,
+        "seconds": 0
+    }
+
+def get_db_host(site, sites_path):
+    """Get the database server a site uses, as host:port"""
+    conf = frappe.get_site_config(sites_path=sites_path, site_path=os.path.join(sites_path, site))
+    return "{0}:{1}".format(conf.get("db_host") or "localhost", conf.get("db_port") or 3306)
+
+def get_summary_totals(summary):
+    """Aggregate per-site results into one line of totals"""
+    results = summary["results"]
+    return {
+        "sites": len(results),
+        "ok": len([result for result in results if result["status"] == "ok"]),
+        "skipped": len([result for result in results if result["status"] == "skipped"]),
+        "failed": len([result for result in results if result["status"] == "failed"]),
+        "retried": len([result for result in results if result.get("attempts", 1) > 1]),
+        "updated": sum(result["updated"] for result in results),
+        "drift": sum(result["drift"] for result in results),
+        "repaired": sum(result["repaired"] for result in results),
+        "seconds": summary["seconds"],
+        "site_seconds": round(sum(result["seconds"] for result in results), 2),
+        "processes": summary["processes"],
+        "per_db_host": summary["per_db_host"]
+    }
@@ -0,0 +1,85 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import frappe
+
+ASSIGNMENT_DELTA_EVENT = "rm_ivalue_assignment_delta"
+
+# Redis set of employees whose deltas are waiting for the publishing job
+DELTA_EMPLOYEES_KEY = "rm_ivalue:delta_employees"
+
+# Beyond this many employees, open dashboards are told to refresh instead
+MAX_DELTA_EMPLOYEES = 200
+
+def queue_assignment_deltas(employees):
+    """Publish dashboard deltas for the employees once the current transaction commits"""
+    employees = {employee for employee in employees if employee}
+    if not employees:
+        return
+
+    pending = frappe.flags.rm_ivalue_delta_employees
+    if pending is None:
+        pending = frappe.flags.rm_ivalue_delta_employees = set()
+        frappe.db.after_commit.add(enqueue_queued_deltas)
+        frappe.db.after_rollback.add(discard_queued_deltas)
+
+    pending.update(employees)
+
+def discard_queued_deltas():
+    frappe.flags.rm_ivalue_delta_employees = None
+
+def enqueue_queued_deltas():
+    """Hand the employees changed in the committed transaction to a background job.
+
+    The rows are rebuilt off the write path. Employees wait in a shared set,
+    so one job publishes every change committed before it runs and the jobs
+    behind it find nothing left to do."""
+    employees = frappe.flags.rm_ivalue_delta_employees
+    frappe.flags.rm_ivalue_delta_employees = None
+    if not employees:
+        return
+
+    try:
+        frappe.cache().sadd(DELTA_EMPLOYEES_KEY, *employees)
+        frappe.enqueue("rm_ivalue.rm_ivalue.realtime.publish_pending_deltas", queue="short")
+    except Exception:
+        frappe.logger("rm_ivalue").exception("Could not queue assignment deltas")
+
+def publish_pending_deltas():
+    """Send the rebuilt dashboard rows of every employee waiting in the set"""
+    cache = frappe.cache()
+    employees = sorted(
+        employee.decode() if isinstance(employee, bytes) else employee
+        for employee in cache.smembers(DELTA_EMPLOYEES_KEY)
+    )
+    if not employees:
+        return
+
+    # Employees added from here on stay in the set for the next job
+    cache.srem(DELTA_EMPLOYEES_KEY, *employees)
+
+    if len(employees) > MAX_DELTA_EMPLOYEES:
+        message = {"refresh": 1}
+    else:
+        message = get_assignment_deltas(employees)
+
+    # Only users subscribed to the doctype room, which requires read permission, receive it
+    frappe.publish_realtime(ASSIGNMENT_DELTA_EVENT, message, doctype="Project Assignment")
+
+def get_assignment_deltas(employees):
+    """Get the rows of the employees as both dashboards would build them.
+
+    Only the changed employees are read; open dashboards recompute their
+    chart and summary from the patched rows."""
+    from rm_ivalue.rm_ivalue.report.employee_assignment_dashboard.employee_assignment_dashboard import (
+        get_data as get_dashboard_rows,
+    )
+    from rm_ivalue.rm_ivalue.report.resource_allocation_status.resource_allocation_status import (
+        get_data as get_allocation_rows,
+    )
+
+    return {
+        "employees": employees,
+        "dashboard_rows": get_dashboard_rows({"employees": employees}),
+        "allocation_rows": get_allocation_rows({"employees": employees})
+    }
@@ -0,0 +1,349 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import time
+
+import frappe
+from frappe.utils import add_days, date_diff, flt, getdate, today
+from rm_ivalue.rm_ivalue.allocation import get_allocation_segments, get_peak_allocation
+from rm_ivalue.rm_ivalue.simulation import SimulationError, apply_change, load_interval_model, summarize
+from rm_ivalue.rm_ivalue.utils import parse_list
+
+MAX_MOVES_PER_EMPLOYEE = 20
+
+@frappe.whitelist()
+def propose_rebalancing(department=None, projects=None, from_date=None, to_date=None, max_seconds=5):
+    """Propose allocation reductions and reassignments that clear over-allocation.
+
+    Greedy interval heuristic: for each over-allocated period, the assignment
+    whose reduction moves the fewest person-days is cut by the excess for that
+    period only and restored to its allocation afterwards, and the excess is
+    reassigned to the least loaded active employee with the same designation
+    and department who can take it for the period. The
+    proposed changes use the simulate_changes format, so the batch can be
+    previewed with it and applied with apply_rebalancing."""
+    if not frappe.has_permission("Project Assignment", "read"):
+        frappe.throw("Not enough permissions to read Project Assignment")
+
+    projects = parse_list(projects)
+    if not department and not projects:
+        frappe.throw("Department or Projects is required")
+
+    window_start = getdate(from_date or today())
+    window_end = getdate(to_date) if to_date else add_days(window_start, 89)
+    if window_end < window_start:
+        frappe.throw("To Date cannot be before From Date")
+
+    deadline = time.monotonic() + min(flt(max_seconds) or 5, 30)
+    employees = get_scope_employees(department, projects, window_start, window_end)
+    pool = get_candidate_pool(employees)
+    model = load_rebalancing_model(set(employees) | set(pool), window_start, window_end)
+    before = {employee: summarize(model[employee], window_start, window_end) for employee in employees}
+
+    planner = RebalancingPlanner(model, pool, projects, window_start, window_end, deadline)
+    for employee in sorted(employees, key=lambda employee: -before[employee]["peak_allocation"]):
+        if before[employee]["overallocated_periods"]:
+            planner.rebalance(employee, employees[employee])
+
+    impact = {}
+    for employee in planner.touched:
+        impact[employee] = {
+            "before": before.get(employee) or planner.initial[employee],
+            "after": summarize(model[employee], window_start, window_end)
+        }
+
+    return {
+        "from_date": window_start,
+        "to_date": window_end,
+        "changes": planner.changes,
+        "moves": planner.moves,
+        "impact": impact,
+        "unresolved": planner.unresolved,
+        "timed_out": planner.timed_out
+    }
+
+@frappe.whitelist()
+def apply_rebalancing(changes, reason=""):
+    """Apply a proposed rebalancing batch as change requests and new submitted assignments.
+
+    Changes may refer to assignments created earlier in the batch by their
+    simulated name (new-<index>), which is resolved as the batch is applied."""
+    if not frappe.has_permission("Project Assignment", "write") or not frappe.has_permission("Project Assignment", "create"):
+        frappe.throw("Not enough permissions to modify Project Assignment")
+
+    reason = reason or "Rebalancing"
+    created = {}
+    for index, change in enumerate(parse_list(changes)):
+        change = frappe._dict(change)
+        if change.type == "new_assignment":
+            assignment = frappe.get_doc({
+                "doctype": "Project Assignment",
+                "project": change.project,
+                "employee": change.employee,
+                "start_date": change.start_date,
+                "end_date": change.end_date,
+                "allocation_percentage": flt(change.allocation_percentage),
+                "allocation_reference": f"Created by rebalancing. Reason: {reason}"
+            })
+            assignment.insert()
+            assignment.submit()
+            created[f"new-{index}"] = assignment.name
+            continue
+
+        assignment = frappe.get_doc("Project Assignment", created.get(change.assignment, change.assignment))
+        if change.type == "end_date":
+            assignment.create_change_request_for_end_date(change.new_end_date, reason)
+        elif change.type == "allocation":
+            created[f"new-{index}"] = assignment.create_change_request_for_allocation(
+                flt(change.new_allocation_percentage), change.effective_date, reason
+            )
+        else:
+            frappe.throw(f"Unknown change type: {change.type}")
+
+    return {"success": True, "created": created}
+
+class RebalancingPlanner:
+    """Greedy, time-bounded search over an in-memory interval model"""
+
+    def __init__(self, model, pool, projects, window_start, window_end, deadline):
+        self.model = model
+        self.pool = pool
+        self.projects = set(projects or [])
+        self.window_start = window_start
+        self.window_end = window_end
+        self.deadline = deadline
+        self.segments = {}
+        self.initial = {}
+        self.touched = []
+        self.changes = []
+        self.moves = []
+        self.unresolved = []
+        self.timed_out = False
+
+    def rebalance(self, employee, qualification):
+        """Resolve the over-allocated periods of one employee in date order"""
+        cursor = self.window_start
+        for _ in range(MAX_MOVES_PER_EMPLOYEE):
+            if time.monotonic() > self.deadline:
+                self.timed_out = True
+                return
+
+            period = self.get_next_overallocation(employee, cursor)
+            if not period:
+                return
+
+            effective_date, period_end, run_end, allocation = period
+            excess = flt(allocation - 100, 2)
+            assignment = self.pick_reduction(employee, effective_date, run_end, excess)
+            reduce_by = flt(min(excess, flt(assignment.allocation_percentage)), 2) if assignment else 0
+            end_date = min(assignment.end_date, run_end) if assignment else None
+            if not assignment or not self.add_reduction(assignment, effective_date, end_date, reduce_by):
+                self.unresolved.append({
+                    "employee": employee,
+                    "from_date": effective_date,
+                    "to_date": period_end,
+                    "allocation": allocation
+                })
+                cursor = add_days(period_end, 1)
+                continue
+
+            candidate = self.pick_candidate(employee, qualification, effective_date, end_date, reduce_by)
+            if candidate:
+                reassigned = self.add_change(candidate, {
+                    "type": "new_assignment",
+                    "employee": candidate,
+                    "project": assignment.project,
+                    "start_date": effective_date,
+                    "end_date": end_date,
+                    "allocation_percentage": reduce_by
+                })
+                candidate = candidate if reassigned else None
+
+            self.moves.append({
+                "employee": employee,
+                "assignment": assignment.name,
+                "project": assignment.project,
+                "effective_date": effective_date,
+                "to_date": end_date,
+                "reduce_by": reduce_by,
+                "reassigned_to": candidate,
+                "person_days": flt(reduce_by / 100 * (date_diff(end_date, effective_date) + 1), 2)
+            })
+
+        self.unresolved.append({"employee": employee, "reason": "Move limit reached"})
+
+    def get_next_overallocation(self, employee, cursor):
+        """Get (from_date, to_date, run_end, allocation) of the first over-allocated segment on or after the cursor.
+
+        run_end is the end of the unbroken run of over-allocated segments it
+        starts, so a cut lasts as long as the conflict and no longer."""
+        segments = self.get_segments(employee)
+        for index, (segment_start, segment_end, allocation) in enumerate(segments):
+            if segment_end < cursor or allocation <= 100:
+                continue
+            if segment_start > self.window_end:
+                break
+
+            run_end = segment_end
+            for next_start, next_end, next_allocation in segments[index + 1:]:
+                if next_start != add_days(run_end, 1) or next_allocation <= 100:
+                    break
+                run_end = next_end
+
+            return (
+                max(segment_start, cursor),
+                min(segment_end, self.window_end),
+                min(run_end, self.window_end),
+                allocation
+            )
+
+        return None
+
+    def pick_reduction(self, employee, effective_date, period_end, excess):
+        """Pick the assignment to cut, preferring one that clears the excess alone with the fewest person-days moved.
+
+        A change request must take effect after the assignment starts, so
+        assignments starting on the effective date cannot be cut there.
+        Assignments whose cut would round to 0% are skipped."""
+        options = []
+        for assignment in self.model[employee].values():
+            allocation = flt(assignment.allocation_percentage)
+            if flt(min(excess, allocation), 2) <= 0 or not (assignment.start_date < effective_date <= assignment.end_date):
+                continue
+            if self.projects and assignment.project not in self.projects:
+                continue
+
+            moved = min(excess, allocation) * (date_diff(min(assignment.end_date, period_end), effective_date) + 1)
+            options.append((allocation < excess, moved, assignment.name, assignment))
+
+        return min(options, key=lambda option: option[:3])[3] if options else None
+
+    def pick_candidate(self, employee, qualification, start_date, end_date, allocation):
+        """Pick the least loaded qualified employee with room for the allocation over the whole range"""
+        best = None
+        for candidate, candidate_qualification in self.pool.items():
+            if candidate == employee or candidate_qualification != qualification:
+                continue
+
+            peak_allocation = get_peak_allocation(self.get_segments(candidate), start_date, end_date)
+            if peak_allocation + allocation <= 100 and (best is None or (peak_allocation, candidate) < best):
+                best = (peak_allocation, candidate)
+
+        return best[1] if best else None
+
+    def add_reduction(self, assignment, effective_date, to_date, reduce_by):
+        """Cut an assignment between two dates and restore its allocation after them.
+
+        The cut ends the assignment instead when nothing would remain; the
+        rest of it is then recreated as a new assignment after the period."""
+        if reduce_by <= 0:
+            return False
+
+        allocation = flt(assignment.allocation_percentage)
+        original_end_date = assignment.end_date
+        remaining = flt(allocation - reduce_by, 2)
+        if not remaining and add_days(effective_date, -1) > assignment.start_date:
+            if not self.add_change(assignment.employee, {
+                "type": "end_date",
+                "assignment": assignment.name,
+                "new_end_date": add_days(effective_date, -1)
+            }):
+                return False
+            restore = {
+                "type": "new_assignment",
+                "employee": assignment.employee,
+                "project": assignment.project,
+                "start_date": add_days(to_date, 1),
+                "end_date": original_end_date,
+                "allocation_percentage": allocation
+            }
+        else:
+            if not self.add_change(assignment.employee, {
+                "type": "allocation",
+                "assignment": assignment.name,
+                "new_allocation_percentage": remaining,
+                "effective_date": effective_date
+            }):
+                return False
+            restore = {
+                "type": "allocation",
+                # The split created by the cut, named after its position in the batch
+                "assignment": f"new-{len(self.changes) - 1}",
+                "new_allocation_percentage": allocation,
+                "effective_date": add_days(to_date, 1)
+            }
+
+        if to_date < original_end_date:
+            self.add_change(assignment.employee, restore)
+        return True
+
+    def add_change(self, employee, change):
+        """Apply a change to the model with the simulation rules and record it if it is valid"""
+        if employee not in self.touched:
+            self.touched.append(employee)
+            self.initial[employee] = summarize(self.model[employee], self.window_start, self.window_end)
+
+        change = frappe._dict(change)
+        try:
+            apply_change(self.model, change, len(self.changes))
+        except SimulationError:
+            return False
+
+        self.changes.append(change)
+        self.segments.pop(employee, None)
+        return True
+
+    def get_segments(self, employee):
+        if employee not in self.segments:
+            self.segments[employee] = get_allocation_segments(self.model[employee].values())
+        return self.segments[employee]
+
+def get_scope_employees(department=None, projects=None, window_start=None, window_end=None):
+    """Get the employees to rebalance as a mapping of employee to (department, designation)"""
+    filters = {"status": "Active"}
+    if department:
+        filters["department"] = department
+    if projects:
+        filters["name"] = ["in", frappe.get_all(
+            "Project Assignment",
+            filters={
+                "project": ["in", projects],
+                "docstatus": 1,
+                "start_date": ["<=", window_end],
+                "end_date": [">=", window_start]
+            },
+            pluck="employee",
+            distinct=True
+        ) or [""]]
+
+    return {
+        employee.name: (employee.department, employee.designation)
+        for employee in frappe.get_all("Employee", filters=filters, fields=["name", "department", "designation"])
+    }
+
+def get_candidate_pool(employees):
+    """Get active employees of the departments in scope as a mapping of employee to (department, designation)"""
+    departments = list({department for department, designation in employees.values() if department})
+    if not departments:
+        return {}
+
+    return {
+        employee.name: (employee.department, employee.designation)
+        for employee in frappe.get_all(
+            "Employee",
+            filters={"status": "Active", "department": ["in", departments]},
+            fields=["name", "department", "designation"]
+        )
+    }
+
+def load_rebalancing_model(employees, window_start, window_end):
+    """Load the interval model, extended to the last end date so reassignments are checked over their whole range"""
+    model = load_interval_model(employees, window_start, window_end)
+    horizon_end = max(
+        [assignment.end_date for assignments in model.values() for assignment in assignments.values()],
+        default=window_end
+    )
+    if horizon_end > window_end:
+        model = load_interval_model(employees, window_start, horizon_end)
+
+    return model
@@ -0,0 +1,188 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import functools
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import cint
+
+REPLICA_LAG_KEY = "rm_ivalue:replica_lag"
+RECENT_WRITE_KEY = "rm_ivalue:recent_write"
+
+# Cached lag values of a replica whose lag could not be read, or that could not be reached
+LAG_UNKNOWN = -1
+REPLICA_UNAVAILABLE = -2
+
+def replica_read(fn):
+    """Run a read-only function on the read replica unless the replica could serve stale rows.
+
+    Enabled by the rm_ivalue_read_from_replica site config together with
+    Frappe's replica_host settings. The primary is used while the request
+    has uncommitted writes, for a window after the user's own assignment
+    changes, and when replication lag is unknown or above the threshold.
+
+    Reading the lag with SHOW SLAVE STATUS needs the REPLICATION CLIENT
+    privilege (SLAVE MONITOR on MariaDB 10.5+), which site database users
+    do not have by default. Grant it to the replica user, or set
+    rm_ivalue_replica_lag_check to 0 to rely on the read-your-writes window
+    alone."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        kwargs = frappe.get_newargs(fn, kwargs)
+        if not is_replica_enabled():
+            return fn(*args, **kwargs)
+
+        switched, lag, reason = False, None, get_primary_reason()
+        if not reason:
+            switched, lag, reason = connect_replica()
+
+        method = f"{fn.__module__}.{fn.__qualname__}"
+        if reason:
+            log_route(method, "primary", reason, lag)
+            with primary_connection():
+                return fn(*args, **kwargs)
+
+        log_route(method, "replica", None, lag)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if switched:
+                restore_primary()
+
+    return wrapper
+
+def is_replica_enabled():
+    return bool(frappe.conf.get("rm_ivalue_read_from_replica") and frappe.conf.get("replica_host"))
+
+def is_on_replica():
+    """Whether the current connection is the replica swapped in by Frappe's connect_replica"""
+    primary = getattr(frappe.local, "primary_db", None)
+    return primary is not None and frappe.local.db is not primary
+
+def get_primary_reason():
+    """Get why this read must see the primary's latest writes, if it must"""
+    primary = getattr(frappe.local, "primary_db", None) or frappe.db
+    if primary.transaction_writes:
+        return "uncommitted_writes"
+    if frappe.cache().get_value(get_recent_write_key()):
+        return "read_your_writes"
+    return None
+
+def connect_replica():
+    """Switch to the replica connection and check its lag.
+
+    Returns (switched, lag, reason); a reason means the primary must be used."""
+    check_lag = is_lag_check_enabled()
+    lag = frappe.cache().get_value(REPLICA_LAG_KEY)
+    if lag is not None and not check_lag and cint(lag) != REPLICA_UNAVAILABLE:
+        lag = None
+    if lag is not None and get_lag_reason(lag):
+        # Bad and failed readings are cached like good ones, so requests do not retry the replica each time
+        return False, lag, get_lag_reason(lag)
+
+    switched = False
+    try:
+        switched = frappe.connect_replica()
+        if lag is None and check_lag:
+            lag = measure_replica_lag()
+    except Exception:
+        frappe.logger("rm_ivalue").warning("Read replica unavailable, using primary", exc_info=True)
+        if switched:
+            restore_primary()
+        cache_replica_lag(REPLICA_UNAVAILABLE)
+        return False, REPLICA_UNAVAILABLE, get_lag_reason(REPLICA_UNAVAILABLE)
+
+    reason = get_lag_reason(lag)
+    if reason and switched:
+        restore_primary()
+        switched = False
+
+    return switched, lag, reason
+
+def measure_replica_lag():
+    """Read the replication delay of the current replica connection in seconds, -1 when unknown.
+
+    Cached for a few seconds so busy pages do not query the replica status on every call."""
+    try:
+        status = frappe.db.sql("SHOW SLAVE STATUS", as_dict=True)
+    except Exception:
+        # Usually the missing REPLICATION CLIENT privilege
+        frappe.logger("rm_ivalue").warning("Could not read replica lag, using primary", exc_info=True)
+        status = None
+
+    lag = status[0].get("Seconds_Behind_Master") if status else None
+    lag = LAG_UNKNOWN if lag is None else cint(lag)
+    cache_replica_lag(lag)
+    return lag
+
+def cache_replica_lag(lag):
+    frappe.cache().set_value(
+        REPLICA_LAG_KEY,
+        lag,
+        expires_in_sec=cint(frappe.conf.get("rm_ivalue_replica_lag_check_interval") or 5)
+    )
+
+def is_lag_check_enabled():
+    return bool(cint(frappe.conf.get("rm_ivalue_replica_lag_check", 1)))
+
+def get_lag_reason(lag):
+    if cint(lag) == REPLICA_UNAVAILABLE:
+        return "replica_unavailable"
+    if cint(lag) < 0:
+        return "replica_lag_unknown"
+    if cint(lag) > cint(frappe.conf.get("rm_ivalue_replica_max_lag") or 10):
+        return "replica_lag"
+    return None
+
+def restore_primary():
+    """Close the replica connection and switch back, as frappe.read_only does"""
+    frappe.local.db.close()
+    frappe.local.db = frappe.local.primary_db
+    del frappe.local.replica_db
+    del frappe.local.primary_db
+
+@contextmanager
+def primary_connection():
+    """Use the primary for a block, even inside an outer frappe.read_only block"""
+    current = frappe.local.db
+    primary = getattr(frappe.local, "primary_db", None)
+    if primary is None or primary is current:
+        yield
+        return
+
+    frappe.local.db = primary
+    try:
+        yield
+    finally:
+        frappe.local.db = current
+
+def get_recent_write_key():
+    return f"{RECENT_WRITE_KEY}:{frappe.session.user}"
+
+def mark_recent_write():
+    """Keep the session user's replica reads on the primary for a while after they change assignments"""
+    if not is_replica_enabled():
+        return
+
+    frappe.cache().set_value(
+        get_recent_write_key(),
+        1,
+        expires_in_sec=cint(frappe.conf.get("rm_ivalue_read_your_writes_window") or 30)
+    )
+
+def hget_cached(key, field, generator):
+    """frappe.cache().hget with a generator, except rows read from the replica are never cached for everyone"""
+    if not is_on_replica():
+        return frappe.cache().hget(key, field, generator=generator)
+
+    value = frappe.cache().hget(key, field)
+    return value if value is not None else generator()
+
+def log_route(method, target, reason, lag):
+    frappe.logger("rm_ivalue").info({
+        "replica_routing": method,
+        "target": target,
+        "reason": reason,
+        "lag": lag
+    })
@@ -0,0 +1,131 @@
+// Copyright (c) 2023, Yazan Hamdan and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["Employee Assignment Dashboard"] = {
+    "filters": [],
+
+    onload: function(report) {
+        // Patch rows, chart and summary cards from assignment deltas instead of re-running the report
+        frappe.realtime.doctype_subscribe("Project Assignment");
+        frappe.realtime.on("rm_ivalue_assignment_delta", function(delta) {
+            if (frappe.query_report !== report || !report.datatable) {
+                return;
+            }
+
+            if (delta.refresh) {
+                refresh_dashboard(report);
+                return;
+            }
+
+            apply_dashboard_delta(report, delta);
+        });
+    }
+};
+
+const refresh_dashboard = frappe.utils.debounce(report => report.refresh(), 2000);
+
+function apply_dashboard_delta(report, delta) {
+    let changed_rows = {};
+    delta.dashboard_rows.forEach(row => changed_rows[row.employee] = row);
+
+    let data = report.data.map(row => {
+        let changed = changed_rows[row.employee];
+        delete changed_rows[row.employee];
+        return changed || row;
+    });
+    Object.values(changed_rows).forEach(row => data.push(row));
+
+    report.data = data;
+    report.datatable.refresh(data);
+
+    // Chart and summary are recomputed from the patched rows, so a delta only carries changed employees
+    let totals = get_dashboard_totals(data);
+    report.render_summary(get_dashboard_summary(totals));
+    report.render_chart(report.get_chart_options({
+        columns: report.columns,
+        result: data,
+        chart: get_dashboard_chart(totals)
+    }));
+}
+
+// Mirrors add_row_to_totals in employee_assignment_dashboard.py
+function get_dashboard_totals(data) {
+    let totals = {
+        total_employees: 0,
+        total_active_assignments: 0,
+        total_allocation: 0,
+        allocation_status_count: {},
+        department_allocation: {}
+    };
+
+    data.forEach(row => {
+        totals.total_employees += 1;
+        totals.total_active_assignments += row.active_assignments || 0;
+        totals.total_allocation += row.current_allocation || 0;
+
+        let status = row.allocation_status || "Available";
+        totals.allocation_status_count[status] = (totals.allocation_status_count[status] || 0) + 1;
+
+        let dept = row.department || "No Department";
+        if (!totals.department_allocation[dept]) {
+            totals.department_allocation[dept] = {total: 0, allocated: 0};
+        }
+        totals.department_allocation[dept].total += 1;
+        if ((row.current_allocation || 0) > 0) {
+            totals.department_allocation[dept].allocated += 1;
+        }
+    });
+
+    return totals;
+}
+
+// Mirrors get_chart_data in employee_assignment_dashboard.py
+function get_dashboard_chart(totals) {
+    let departments = Object.values(totals.department_allocation);
+
+    return [
+        {
+            name: "Allocation Status Distribution",
+            chart_name: "Allocation Status",
+            chart_type: "donut",
+            data: {
+                labels: Object.keys(totals.allocation_status_count),
+                datasets: [{
+                    name: "Employees",
+                    values: Object.values(totals.allocation_status_count)
+                }]
+            }
+        },
+        {
+            name: "Department Allocation Overview",
+            chart_name: "Department Allocation",
+            chart_type: "bar",
+            data: {
+                labels: Object.keys(totals.department_allocation),
+                datasets: [
+                    {
+                        name: "Total Employees",
+                        values: departments.map(dept => dept.total)
+                    },
+                    {
+                        name: "Allocated Employees",
+                        values: departments.map(dept => dept.allocated)
+                    }
+                ]
+            }
+        }
+    ];
+}
+
+// Mirrors get_report_summary in employee_assignment_dashboard.py
+function get_dashboard_summary(totals) {
+    let avg_allocation = totals.total_employees > 0 ? totals.total_allocation / totals.total_employees : 0;
+
+    return [
+        {value: totals.total_employees, label: "Total Employees", indicator: "Blue", datatype: "Int"},
+        {value: totals.allocation_status_count["Available"] || 0, label: "Available Employees", indicator: "Green", datatype: "Int"},
+        {value: totals.allocation_status_count["Allocated"] || 0, label: "Allocated Employees", indicator: "Orange", datatype: "Int"},
+        {value: totals.total_active_assignments, label: "Total Active Assignments", indicator: "Blue", datatype: "Int"},
+        {value: Math.round(avg_allocation * 10) / 10, label: "Average Allocation %", indicator: "Purple", datatype: "Percent"}
+    ];
+}
@@ -2,16 +2,30 @@
 # For license information, please see license.txt
 
 import frappe
-from frappe.utils import getdate, today, date_diff, flt
+from frappe.utils import cint, getdate, today, date_diff, flt
 from frappe.utils.dashboard import cache_source
+from rm_ivalue.rm_ivalue.archive import get_archived_assignments
+from rm_ivalue.rm_ivalue.assignment_cache import INDEX_FIELDS, get_employee_assignments
+from rm_ivalue.rm_ivalue.replica import replica_read
+from rm_ivalue.rm_ivalue.utils import SectionTimer
 
 @frappe.whitelist()
+@replica_read
 def execute(filters=None):
+    timer = SectionTimer("Employee Assignment Dashboard")
+    
     columns = get_columns()
-    data = get_data(filters)
-    chart = get_chart_data(data)
-    summary = get_report_summary(data)
+    totals = get_empty_totals()
+    
+    # Chart and summary aggregates are collected while the rows are built
+    with timer.section("data"):
+        data = get_data(filters, totals)
+    with timer.section("chart"):
+        chart = get_chart_data(totals)
+    with timer.section("summary"):
+        summary = get_report_summary(totals)
     
+    timer.log()
     return columns, data, None, chart, summary
 
 def get_columns():
@@ -97,7 +111,11 @@ def get_columns():
         }
     ]
 
-def get_data(filters):
+def get_data(filters, totals=None):
+    # Realtime deltas rebuild the rows of a few employees only
+    employees_filter = (filters or {}).get("employees")
+    values = {"employees": employees_filter}
+    
     # Get all employees
     employee_query = """
         SELECT 
@@ -110,12 +128,13 @@ def get_data(filters):
             emp.relieving_date
         FROM `tabEmployee` emp
         WHERE emp.status != 'Left'
+        {employee_condition}
         ORDER BY emp.employee_name
-    """
+    """.format(employee_condition="AND emp.name IN %(employees)s" if employees_filter else "")
     
-    employees = frappe.db.sql(employee_query, as_dict=True)
+    employees = frappe.db.sql(employee_query, values, as_dict=True)
     
-    # Get all project assignments
+    # Get all submitted project assignments, drafts never count towards the dashboard
     assignment_query = """
         SELECT 
             pa.employee,
@@ -128,11 +147,12 @@ def get_data(filters):
             pa.status as assignment_status,
             pa.docstatus
         FROM `tabProject Assignment` pa
-        WHERE pa.docstatus != 2
+        WHERE pa.docstatus = 1
+        {employee_condition}
         ORDER BY pa.employee, pa.start_date
-    """
+    """.format(employee_condition="AND pa.employee IN %(employees)s" if employees_filter else "")
     
-    assignments = frappe.db.sql(assignment_query, as_dict=True)
+    assignments = frappe.db.sql(assignment_query, values, as_dict=True)
     
     # Group assignments by employee
     employee_assignments = {}
@@ -147,86 +167,101 @@ def get_data(filters):
     today_date = getdate(today())
     
     for employee in employees:
-        emp_id = employee.employee
-        emp_assignments = employee_assignments.get(emp_id, [])
+        row = get_employee_row(employee, employee_assignments.get(employee.employee, []), today_date)
+        data.append(row)
         
-        # Calculate assignment statistics
-        total_assignments = len([a for a in emp_assignments if a.docstatus == 1])
-        active_assignments = len([a for a in emp_assignments 
-                                if a.assignment_status == 'Active' and a.docstatus == 1])
-        planned_assignments = len([a for a in emp_assignments 
-                                 if a.assignment_status == 'Planned' and a.docstatus == 1])
-        completed_assignments = len([a for a in emp_assignments 
-                                   if a.assignment_status == 'Completed' and a.docstatus == 1])
-        
-        # Calculate current allocation
-        current_allocation = 0
-        for assignment in emp_assignments:
-            if (assignment.assignment_status == 'Active' and 
-                assignment.docstatus == 1 and
-                getdate(assignment.start_date) <= today_date <= getdate(assignment.end_date)):
-                current_allocation += flt(assignment.allocation_percentage)
+        if totals is not None:
+            add_row_to_totals(totals, row)
+    
+    return data
+
+def get_employee_row(employee, emp_assignments, today_date):
+    """Build the dashboard row of an employee in a single pass over their assignments"""
+    total_assignments = 0
+    active_assignments = 0
+    planned_assignments = 0
+    completed_assignments = 0
+    current_allocation = 0
+    last_assignment_end = None
+    availability_date = today_date
+    
+    for assignment in emp_assignments:
+        if assignment.docstatus != 1:
+            continue
         
-        # Determine allocation status
-        if current_allocation == 0:
-            allocation_status = "Available"
-        elif current_allocation <= 100:
-            allocation_status = "Allocated"
-        else:
-            allocation_status = "Over-allocated"
+        total_assignments += 1
+        end_date = getdate(assignment.end_date)
         
-        # Find last assignment end date
-        last_assignment_end = None
-        submitted_assignments = [a for a in emp_assignments if a.docstatus == 1]
-        if submitted_assignments:
-            last_assignment_end = max([getdate(a.end_date) for a in submitted_assignments])
+        if not last_assignment_end or end_date > last_assignment_end:
+            last_assignment_end = end_date
         
-        # Calculate availability date
-        availability_date = None
-        active_and_planned = [a for a in emp_assignments 
-                            if a.assignment_status in ['Active', 'Planned'] and a.docstatus == 1]
-        if active_and_planned:
-            availability_date = max([getdate(a.end_date) for a in active_and_planned])
-            if availability_date <= today_date:
-                availability_date = today_date
-        else:
-            availability_date = today_date
+        if assignment.assignment_status == 'Active':
+            active_assignments += 1
+            if getdate(assignment.start_date) <= today_date <= end_date:
+                current_allocation += flt(assignment.allocation_percentage)
+        elif assignment.assignment_status == 'Planned':
+            planned_assignments += 1
+        elif assignment.assignment_status == 'Completed':
+            completed_assignments += 1
         
-        data.append({
-            "employee": emp_id,
-            "employee_name": employee.employee_name,
-            "department": employee.department,
-            "designation": employee.designation,
-            "status": employee.status,
-            "total_assignments": total_assignments,
-            "active_assignments": active_assignments,
-            "current_allocation": current_allocation,
-            "allocation_status": allocation_status,
-            "upcoming_assignments": planned_assignments,
-            "completed_assignments": completed_assignments,
-            "last_assignment_end": last_assignment_end,
-            "availability_date": availability_date
-        })
+        # Employee becomes available once the last active or planned assignment ends
+        if assignment.assignment_status in ['Active', 'Planned'] and end_date > availability_date:
+            availability_date = end_date
     
-    return data
+    # Determine allocation status
+    if current_allocation == 0:
+        allocation_status = "Available"
+    elif current_allocation <= 100:
+        allocation_status = "Allocated"
+    else:
+        allocation_status = "Over-allocated"
+    
+    return {
+        "employee": employee.employee,
+        "employee_name": employee.employee_name,
+        "department": employee.department,
+        "designation": employee.designation,
+        "status": employee.status,
+        "total_assignments": total_assignments,
+        "active_assignments": active_assignments,
+        "current_allocation": current_allocation,
+        "allocation_status": allocation_status,
+        "upcoming_assignments": planned_assignments,
+        "completed_assignments": completed_assignments,
+        "last_assignment_end": last_assignment_end,
+        "availability_date": availability_date
+    }
 
-def get_chart_data(data):
-    # Chart 1: Allocation Status Distribution
-    allocation_status_count = {}
-    department_allocation = {}
+def get_empty_totals():
+    return frappe._dict({
+        "total_employees": 0,
+        "total_active_assignments": 0,
+        "total_allocation": 0,
+        "allocation_status_count": {},
+        "department_allocation": {}
+    })
+
+def add_row_to_totals(totals, row):
+    """Fold a dashboard row into the chart and summary aggregates"""
+    totals.total_employees += 1
+    totals.total_active_assignments += row.get('active_assignments', 0)
+    totals.total_allocation += row.get('current_allocation', 0)
     
-    for row in data:
-        # Count allocation status
-        status = row.get('allocation_status', 'Available')
-        allocation_status_count[status] = allocation_status_count.get(status, 0) + 1
-        
-        # Department wise allocation
-        dept = row.get('department', 'No Department')
-        if dept not in department_allocation:
-            department_allocation[dept] = {'total': 0, 'allocated': 0}
-        department_allocation[dept]['total'] += 1
-        if row.get('current_allocation', 0) > 0:
-            department_allocation[dept]['allocated'] += 1
+    # Count allocation status
+    status = row.get('allocation_status', 'Available')
+    totals.allocation_status_count[status] = totals.allocation_status_count.get(status, 0) + 1
+    
+    # Department wise allocation
+    dept = row.get('department') or 'No Department'
+    if dept not in totals.department_allocation:
+        totals.department_allocation[dept] = {'total': 0, 'allocated': 0}
+    totals.department_allocation[dept]['total'] += 1
+    if row.get('current_allocation', 0) > 0:
+        totals.department_allocation[dept]['allocated'] += 1
+
+def get_chart_data(totals):
+    allocation_status_count = totals.allocation_status_count
+    department_allocation = totals.department_allocation
     
     charts = [
         {
@@ -263,14 +298,13 @@ def get_chart_data(data):
     
     return charts
 
-def get_report_summary(data):
-    total_employees = len(data)
-    available_employees = len([d for d in data if d.get('allocation_status') == 'Available'])
-    allocated_employees = len([d for d in data if d.get('allocation_status') == 'Allocated'])
-    over_allocated_employees = len([d for d in data if d.get('allocation_status') == 'Over-allocated'])
+def get_report_summary(totals):
+    total_employees = totals.total_employees
+    available_employees = totals.allocation_status_count.get('Available', 0)
+    allocated_employees = totals.allocation_status_count.get('Allocated', 0)
     
-    total_active_assignments = sum([d.get('active_assignments', 0) for d in data])
-    avg_allocation = sum([d.get('current_allocation', 0) for d in data]) / total_employees if total_employees > 0 else 0
+    total_active_assignments = totals.total_active_assignments
+    avg_allocation = totals.total_allocation / total_employees if total_employees > 0 else 0
     
     return [
         {
@@ -306,45 +340,87 @@ def get_report_summary(data):
     ]
 
 @frappe.whitelist()
-def get_employee_assignment_details(employee):
+@replica_read
+def get_employee_assignment_details(employee, include_archived=0):
     """Get detailed assignment information for a specific employee"""
     if not frappe.has_permission("Project Assignment", "read"):
         frappe.throw("Not enough permissions to read Project Assignment")
     
-    assignments = frappe.get_all(
-        "Project Assignment",
-        filters={
-            "employee": employee,
-            "docstatus": ["!=", 2]
-        },
-        fields=[
-            "name", "project", "project_name", "start_date", "end_date",
-            "allocation_percentage", "status", "docstatus", "creation"
-        ],
-        order_by="start_date desc"
-    )
+    # The index holds non-cancelled assignments ordered by start date ascending
+    assignments = get_employee_assignments(employee)
     
-    return assignments
+    if cint(include_archived):
+        assignments = get_archived_assignments({"employee": employee}, INDEX_FIELDS) + assignments
+    
+    return list(reversed(assignments))
 
 @frappe.whitelist()
-def get_department_summary():
-    """Get department-wise summary"""
+@replica_read
+def get_department_summary(from_date=None, to_date=None):
+    """Get department-wise summary, optionally limited to assignments overlapping a date window.
+
+    Without a window, employees_with_assignments counts any submitted
+    assignment, while the active and allocation figures only concern
+    assignments running today."""
     if not frappe.has_permission("Employee", "read"):
         frappe.throw("Not enough permissions to read Employee")
     
+    if from_date or to_date:
+        employees_with_assignments = "COUNT(pa.employee)"
+        window = {"from_date": from_date, "to_date": to_date}
+    else:
+        # One probe of the (employee, docstatus, start_date) index per employee
+        employees_with_assignments = """COUNT(CASE WHEN EXISTS (
+                SELECT 1 FROM `tabProject Assignment` hist
+                WHERE hist.employee = emp.name AND hist.docstatus = 1
+            ) THEN 1 END)"""
+        # Active and current assignments run today, so past ones need not be aggregated
+        window = {"from_date": today(), "to_date": today()}
+    
+    # The end date bound is served by the (docstatus, end_date) index, so only
+    # assignments still running on from_date are aggregated, not the full history
+    window_conditions = []
+    if window["from_date"]:
+        window_conditions.append("AND end_date >= %(from_date)s")
+    if window["to_date"]:
+        window_conditions.append("AND start_date <= %(to_date)s")
+    
+    # Assignments are aggregated per employee before the join, so every employee
+    # contributes exactly one row and the join grows with headcount, not history
     query = """
         SELECT 
             COALESCE(emp.department, 'No Department') as department,
             COUNT(emp.name) as total_employees,
             COUNT(CASE WHEN emp.status = 'Active' THEN 1 END) as active_employees,
-            COUNT(DISTINCT pa.employee) as employees_with_assignments,
-            COUNT(CASE WHEN pa.status = 'Active' AND pa.docstatus = 1 THEN 1 END) as active_assignments,
-            ROUND(AVG(CASE WHEN pa.status = 'Active' AND pa.docstatus = 1 THEN pa.allocation_percentage END), 2) as avg_allocation
+            {employees_with_assignments} as employees_with_assignments,
+            COALESCE(SUM(pa.active_assignments), 0) as active_assignments,
+            ROUND(SUM(pa.active_allocation) / NULLIF(SUM(pa.active_assignments), 0), 2) as avg_allocation,
+            COUNT(CASE WHEN COALESCE(pa.current_allocation, 0) = 0 THEN 1 END) as available_employees,
+            COUNT(CASE WHEN pa.current_allocation > 0 AND pa.current_allocation <= 100 THEN 1 END) as allocated_employees,
+            COUNT(CASE WHEN pa.current_allocation > 100 THEN 1 END) as over_allocated_employees
         FROM `tabEmployee` emp
-        LEFT JOIN `tabProject Assignment` pa ON emp.name = pa.employee AND pa.docstatus = 1
+        LEFT JOIN (
+            SELECT 
+                employee,
+                COUNT(CASE WHEN status = 'Active' THEN 1 END) as active_assignments,
+                SUM(CASE WHEN status = 'Active' THEN allocation_percentage ELSE 0 END) as active_allocation,
+                SUM(CASE WHEN start_date <= %(today)s AND end_date >= %(today)s 
+                    THEN allocation_percentage ELSE 0 END) as current_allocation
+            FROM `tabProject Assignment`
+            WHERE docstatus = 1
+            {window_conditions}
+            GROUP BY employee
+        ) pa ON pa.employee = emp.name
         WHERE emp.status != 'Left'
         GROUP BY COALESCE(emp.department, 'No Department')
         ORDER BY total_employees DESC
-    """
+    """.format(
+        employees_with_assignments=employees_with_assignments,
+        window_conditions=" ".join(window_conditions)
+    )
     
-    return frappe.db.sql(query, as_dict=True)
+    return frappe.db.sql(query, {
+        "today": getdate(today()),
+        "from_date": window["from_date"],
+        "to_date": window["to_date"]
+    }, as_dict=True)
@@ -0,0 +1,59 @@
+// Copyright (c) 2023, Yazan Hamdan and contributors
+// For license information, please see license.txt
+
+// Mirrors BANDS in employee_utilization_heatmap.py
+const UTILIZATION_BANDS = [
+    { upto: 0, color: "#f0f4f7" },
+    { upto: 50, color: "#cde8ff" },
+    { upto: 80, color: "#7cd6fd" },
+    { upto: 100, color: "#26be8d" },
+    { upto: null, color: "#ff5858" }
+];
+
+function get_band_color(value) {
+    for (let band of UTILIZATION_BANDS) {
+        if (band.upto === null || value <= band.upto) {
+            return band.color;
+        }
+    }
+}
+
+frappe.query_reports["Employee Utilization Heatmap"] = {
+    "filters": [
+        {
+            "fieldname": "from_date",
+            "label": __("From Week"),
+            "fieldtype": "Date",
+            "default": frappe.datetime.get_today(),
+            "reqd": 1
+        },
+        {
+            "fieldname": "weeks",
+            "label": __("Weeks"),
+            "fieldtype": "Int",
+            "default": 12,
+            "reqd": 1
+        },
+        {
+            "fieldname": "department",
+            "label": __("Department"),
+            "fieldtype": "Link",
+            "options": "Department"
+        },
+        {
+            "fieldname": "designation",
+            "label": __("Designation"),
+            "fieldtype": "Link",
+            "options": "Designation"
+        }
+    ],
+    "formatter": function(value, row, column, data, default_formatter) {
+        // Week columns are named w0, w1, ...
+        if (data && /^w\d+$/.test(column.fieldname)) {
+            let allocation = data[column.fieldname] || 0;
+            return `<div style="background-color: ${get_band_color(allocation)}; text-align: center;">${allocation}</div>`;
+        }
+
+        return default_formatter(value, row, column, data);
+    }
+};
@@ -0,0 +1,274 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, cint, flt, getdate, today
+from rm_ivalue.rm_ivalue.assignment_cache import get_cached_result
+from rm_ivalue.rm_ivalue.replica import replica_read
+from rm_ivalue.rm_ivalue.utils import SectionTimer
+from rm_ivalue.rm_ivalue.working_days import count_working_days, get_holiday_lists
+
+MAX_WEEKS = 52
+
+# Upper bound (inclusive) of each colour band, in allocation %
+BANDS = [
+    {"upto": 0, "label": "Idle", "color": "#f0f4f7"},
+    {"upto": 50, "label": "Light", "color": "#cde8ff"},
+    {"upto": 80, "label": "Busy", "color": "#7cd6fd"},
+    {"upto": 100, "label": "Full", "color": "#26be8d"},
+    {"upto": None, "label": "Over-allocated", "color": "#ff5858"}
+]
+
+@replica_read
+def execute(filters=None):
+    if not filters:
+        filters = {}
+
+    timer = SectionTimer("Employee Utilization Heatmap")
+
+    with timer.section("matrix"):
+        matrix = get_matrix(filters)
+    with timer.section("rows"):
+        columns = get_columns(matrix)
+        data = get_data(matrix)
+
+    timer.log()
+    return columns, data, None, get_chart_data(matrix), get_report_summary(matrix)
+
+@frappe.whitelist()
+@replica_read
+def get_utilization_matrix(filters=None):
+    """Get the employee x week allocation matrix in compact form for custom renderers"""
+    if not frappe.has_permission("Project Assignment", "read"):
+        frappe.throw("Not enough permissions to read Project Assignment")
+
+    return get_matrix(frappe.parse_json(filters or "{}"))
+
+def get_matrix(filters):
+    """Get the compact matrix, cached per filter set until any assignment changes"""
+    filters = {
+        "from_date": str(get_week_start(filters.get("from_date") or today())),
+        "weeks": min(max(cint(filters.get("weeks")) or 12, 1), MAX_WEEKS),
+        "department": filters.get("department"),
+        "designation": filters.get("designation")
+    }
+
+    return get_cached_result("utilization_heatmap", filters, lambda: build_matrix(filters))
+
+def get_week_start(date):
+    date = getdate(date)
+    return add_days(date, -date.weekday())
+
+def build_matrix(filters):
+    """Compute weekly allocation % of every employee in one pass over the assignments.
+
+    Each assignment adds its allocation to a per-employee difference array
+    for the weeks it fully covers; only its first and last partial weeks are
+    weighted by the share of working days they cover."""
+    horizon_start = getdate(filters["from_date"])
+    weeks = filters["weeks"]
+    horizon_end = add_days(horizon_start, weeks * 7 - 1)
+    week_starts = [add_days(horizon_start, week * 7) for week in range(weeks)]
+
+    employee_conditions = get_employee_conditions(filters)
+    employees = frappe.db.sql("""
+        SELECT name, employee_name, department, designation
+        FROM `tabEmployee` emp
+        WHERE emp.status = 'Active'
+        {conditions}
+        ORDER BY employee_name
+    """.format(conditions=employee_conditions), filters, as_dict=True)
+
+    # Scoped by the employees already selected, so no join with Employee is needed
+    assignments = frappe.db.sql("""
+        SELECT pa.employee, pa.start_date, pa.end_date, pa.allocation_percentage
+        FROM `tabProject Assignment` pa
+        WHERE pa.employee IN %(employees)s
+        AND pa.docstatus = 1
+        AND pa.start_date <= %(horizon_end)s
+        AND pa.end_date >= %(horizon_start)s
+    """, {
+        "employees": [employee.name for employee in employees] or [""],
+        "horizon_start": horizon_start,
+        "horizon_end": horizon_end
+    }, as_dict=True)
+
+    holiday_lists = get_holiday_lists([employee.name for employee in employees])
+
+    # Working days of each week, once per holiday list rather than per employee
+    capacity = {}
+    for holiday_list in set(holiday_lists.values()) | {None}:
+        capacity[holiday_list] = [
+            count_working_days(week_start, add_days(week_start, 6), holiday_list)
+            for week_start in week_starts
+        ]
+
+    diff = {employee.name: [0.0] * (weeks + 1) for employee in employees}
+    partial = {employee.name: [0.0] * weeks for employee in employees}
+
+    for assignment in assignments:
+        holiday_list = holiday_lists.get(assignment.employee)
+        week_capacity = capacity[holiday_list]
+        allocation = flt(assignment.allocation_percentage)
+        start_date = max(getdate(assignment.start_date), horizon_start)
+        end_date = min(getdate(assignment.end_date), horizon_end)
+        first_week = (start_date - horizon_start).days // 7
+        last_week = (end_date - horizon_start).days // 7
+
+        for week, from_date, to_date in get_partial_weeks(
+            first_week, last_week, start_date, end_date, week_starts
+        ):
+            if week_capacity[week]:
+                partial[assignment.employee][week] += (
+                    allocation * count_working_days(from_date, to_date, holiday_list) / week_capacity[week]
+                )
+
+        # Weeks strictly between the first and last are fully covered
+        if last_week - first_week > 1:
+            diff[assignment.employee][first_week + 1] += allocation
+            diff[assignment.employee][last_week] -= allocation
+
+    matrix = []
+    for employee in employees:
+        week_capacity = capacity[holiday_lists.get(employee.name)]
+        running = 0.0
+        row = []
+        for week in range(weeks):
+            running += diff[employee.name][week]
+            value = (running if week_capacity[week] else 0) + partial[employee.name][week]
+            row.append(cint(round(value)))
+        matrix.append(row)
+
+    return {
+        "weeks": [str(week_start) for week_start in week_starts],
+        "employees": [
+            [employee.name, employee.employee_name, employee.department, employee.designation]
+            for employee in employees
+        ],
+        "matrix": matrix,
+        "bands": BANDS
+    }
+
+def get_partial_weeks(first_week, last_week, start_date, end_date, week_starts):
+    """Get (week, from_date, to_date) for the first and last week an assignment only partly covers"""
+    if first_week == last_week:
+        return [(first_week, start_date, end_date)]
+
+    return [
+        (first_week, start_date, add_days(week_starts[first_week], 6)),
+        (last_week, week_starts[last_week], end_date)
+    ]
+
+def get_employee_conditions(filters):
+    conditions = []
+
+    if filters.get("department"):
+        conditions.append(" AND emp.department = %(department)s")
+
+    if filters.get("designation"):
+        conditions.append(" AND emp.designation = %(designation)s")
+
+    return " ".join(conditions)
+
+def get_columns(matrix):
+    """Return the employee columns followed by one column per week"""
+    columns = [
+        {
+            "fieldname": "employee",
+            "label": _("Employee ID"),
+            "fieldtype": "Link",
+            "options": "Employee",
+            "width": 120
+        },
+        {
+            "fieldname": "employee_name",
+            "label": _("Employee Name"),
+            "fieldtype": "Data",
+            "width": 160
+        },
+        {
+            "fieldname": "department",
+            "label": _("Department"),
+            "fieldtype": "Data",
+            "width": 120
+        }
+    ]
+
+    for week, week_start in enumerate(matrix["weeks"]):
+        columns.append({
+            "fieldname": f"w{week}",
+            "label": getdate(week_start).strftime("%d %b"),
+            "fieldtype": "Int",
+            "width": 70
+        })
+
+    return columns
+
+def get_data(matrix):
+    data = []
+    for (employee, employee_name, department, designation), row in zip(matrix["employees"], matrix["matrix"]):
+        values = {
+            "employee": employee,
+            "employee_name": employee_name,
+            "department": department
+        }
+        values.update({f"w{week}": value for week, value in enumerate(row)})
+        data.append(values)
+
+    return data
+
+def get_chart_data(matrix):
+    """Average allocation per week across the selected employees"""
+    if not matrix["matrix"]:
+        return None
+
+    employee_count = len(matrix["matrix"])
+    weekly_totals = [sum(column) for column in zip(*matrix["matrix"])]
+
+    return {
+        "type": "line",
+        "data": {
+            "labels": [getdate(week_start).strftime("%d %b") for week_start in matrix["weeks"]],
+            "datasets": [
+                {
+                    "name": _("Average Allocation %"),
+                    "values": [flt(total / employee_count, 1) for total in weekly_totals]
+                }
+            ]
+        },
+        "colors": ["#5e64ff"],
+        "height": 250
+    }
+
+def get_report_summary(matrix):
+    cells = [value for row in matrix["matrix"] for value in row]
+    over_allocated_weeks = len([value for value in cells if value > 100])
+    idle_weeks = len([value for value in cells if value == 0])
+
+    return [
+        {
+            "value": len(matrix["matrix"]),
+            "label": _("Employees"),
+            "indicator": "Blue",
+            "datatype": "Int"
+        },
+        {
+            "value": flt(sum(cells) / len(cells), 1) if cells else 0,
+            "label": _("Average Allocation %"),
+            "indicator": "Purple",
+            "datatype": "Percent"
+        },
+        {
+            "value": over_allocated_weeks,
+            "label": _("Over-allocated Employee Weeks"),
+            "indicator": "Red",
+            "datatype": "Int"
+        },
+        {
+            "value": idle_weeks,
+            "label": _("Idle Employee Weeks"),
+            "indicator": "Green",
+            "datatype": "Int"
+        }
+    ]
@@ -0,0 +1,51 @@
+// Copyright (c) 2023, Yazan Hamdan and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["Project Staffing Rollup"] = {
+    "filters": [
+        {
+            "fieldname": "from_date",
+            "label": __("From Month"),
+            "fieldtype": "Date",
+            "default": frappe.datetime.month_start(),
+            "reqd": 1
+        },
+        {
+            "fieldname": "months",
+            "label": __("Months"),
+            "fieldtype": "Int",
+            "default": 6,
+            "reqd": 1
+        },
+        {
+            "fieldname": "projects",
+            "label": __("Projects"),
+            "fieldtype": "MultiSelectList",
+            "get_data": function(txt) {
+                return frappe.db.get_link_options("Project", txt);
+            }
+        },
+        {
+            "fieldname": "project_status",
+            "label": __("Project Status"),
+            "fieldtype": "Select",
+            "options": "\nOpen\nCompleted\nCancelled",
+            "default": "Open"
+        },
+        {
+            "fieldname": "department",
+            "label": __("Department"),
+            "fieldtype": "Link",
+            "options": "Department"
+        }
+    ],
+    "formatter": function(value, row, column, data, default_formatter) {
+        value = default_formatter(value, row, column, data);
+
+        if (data && ["gap_months", "max_gap_fte"].includes(column.fieldname) && data.gap_months > 0) {
+            value = `<span style="color: red; font-weight: bold;">${value}</span>`;
+        }
+
+        return value;
+    }
+};
@@ -0,0 +1,324 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, add_months, cint, date_diff, flt, get_first_day, get_last_day, getdate, today
+from rm_ivalue.rm_ivalue.assignment_cache import bump_allocation_version, get_cached_result
+from rm_ivalue.rm_ivalue.replica import replica_read
+from rm_ivalue.rm_ivalue.utils import SectionTimer, parse_list
+
+MAX_MONTHS = 24
+
+# Assignments ending within each of these many days from today are counted
+ENDING_WINDOWS = (30, 60, 90)
+
+# Project fields the rollup reads, a change to any of them expires cached rollups
+PROJECT_FIELDS = ("project_name", "status", "expected_end_date")
+
+@replica_read
+def execute(filters=None):
+    if not filters:
+        filters = {}
+
+    timer = SectionTimer("Project Staffing Rollup")
+
+    with timer.section("rollup"):
+        rollup = get_rollup(filters)
+    with timer.section("rows"):
+        columns = get_columns(rollup)
+        data = get_data(rollup)
+
+    timer.log()
+    return columns, data, None, get_chart_data(rollup), get_report_summary(rollup)
+
+@frappe.whitelist()
+@replica_read
+def get_staffing_rollup(filters=None):
+    """Get headcount, FTE, upcoming ends and staffing gaps per project in compact form"""
+    if not frappe.has_permission("Project Assignment", "read"):
+        frappe.throw("Not enough permissions to read Project Assignment")
+
+    return get_rollup(frappe.parse_json(filters or "{}"))
+
+def get_rollup(filters):
+    """Get the rollup, cached per filter set until any assignment changes"""
+    filters = {
+        "from_date": str(get_first_day(filters.get("from_date") or today())),
+        "months": min(max(cint(filters.get("months")) or 6, 1), MAX_MONTHS),
+        "projects": sorted(parse_list(filters.get("projects"))),
+        "project_status": filters.get("project_status"),
+        "department": filters.get("department"),
+        "today": today()
+    }
+
+    return get_cached_result("project_staffing_rollup", filters, lambda: build_rollup(filters))
+
+def on_project_change(doc, method=None):
+    """Expire cached rollups when a project is added, removed or changes a field the rollup reads.
+
+    Expired immediately and once more after commit, so a concurrent reader
+    cannot re-cache the pre-commit project."""
+    if method == "on_update" and not any(doc.has_value_changed(field) for field in PROJECT_FIELDS):
+        return
+
+    bump_allocation_version()
+    frappe.db.after_commit.add(bump_allocation_version)
+
+def build_rollup(filters):
+    """Aggregate the assignments of every project in scope in one grouped query.
+
+    FTE is allocation % / 100. Planned FTE of a month is weighted by the
+    calendar days each assignment covers in it. A month before the project's
+    expected end whose planned FTE falls below the current FTE is a gap."""
+    today_date = getdate(filters["today"])
+    month_starts = [getdate(add_months(filters["from_date"], month)) for month in range(filters["months"])]
+    month_ends = [get_last_day(month_start) for month_start in month_starts]
+
+    projects = get_projects(filters)
+    rows = {
+        project.name: frappe._dict(
+            project=project.name,
+            project_name=project.project_name,
+            expected_end_date=project.expected_end_date,
+            headcount=0,
+            current_fte=0.0,
+            planned_fte=[0.0] * len(month_starts),
+            **{f"ending_{days}": 0 for days in ENDING_WINDOWS}
+        )
+        for project in projects
+    }
+
+    if rows:
+        values = {
+            "projects": list(rows),
+            "today": today_date,
+            "lower_bound": min(today_date, month_starts[0]),
+            # Far enough out for the month columns and the longest ending window
+            "upper_bound": max(getdate(add_days(today_date, max(ENDING_WINDOWS))), month_ends[-1]),
+            "department": filters.get("department")
+        }
+        values.update({f"ending_{days}": add_days(today_date, days) for days in ENDING_WINDOWS})
+
+        month_columns = []
+        for month, (month_start, month_end) in enumerate(zip(month_starts, month_ends)):
+            values.update({f"m{month}_start": month_start, f"m{month}_end": month_end})
+            month_columns.append("""
+                SUM(pa.allocation_percentage * GREATEST(0, DATEDIFF(
+                    LEAST(pa.end_date, %(m{month}_end)s), GREATEST(pa.start_date, %(m{month}_start)s)
+                ) + 1)) as m{month}""".format(month=month))
+
+        ending_columns = [
+            "SUM(pa.end_date >= %(today)s AND pa.end_date <= %(ending_{days})s) as ending_{days}".format(days=days)
+            for days in ENDING_WINDOWS
+        ]
+
+        # Served by the (project, docstatus, start_date) index
+        aggregates = frappe.db.sql("""
+            SELECT
+                pa.project,
+                COUNT(DISTINCT CASE WHEN pa.start_date <= %(today)s AND pa.end_date >= %(today)s
+                    THEN pa.employee END) as headcount,
+                SUM(CASE WHEN pa.start_date <= %(today)s AND pa.end_date >= %(today)s
+                    THEN pa.allocation_percentage ELSE 0 END) as current_allocation,
+                {ending_columns},
+                {month_columns}
+            FROM `tabProject Assignment` pa
+            WHERE pa.project IN %(projects)s
+            AND pa.docstatus = 1
+            AND pa.start_date <= %(upper_bound)s
+            AND pa.end_date >= %(lower_bound)s
+            {conditions}
+            GROUP BY pa.project
+        """.format(
+            ending_columns=", ".join(ending_columns),
+            month_columns=",".join(month_columns),
+            conditions=" AND pa.department = %(department)s" if filters.get("department") else ""
+        ), values, as_dict=True)
+
+        for aggregate in aggregates:
+            row = rows[aggregate.project]
+            row.headcount = cint(aggregate.headcount)
+            row.current_fte = flt(flt(aggregate.current_allocation) / 100, 2)
+            row.planned_fte = [
+                flt(flt(aggregate[f"m{month}"]) / (100 * (date_diff(month_end, month_start) + 1)), 2)
+                for month, (month_start, month_end) in enumerate(zip(month_starts, month_ends))
+            ]
+            row.update({f"ending_{days}": cint(aggregate[f"ending_{days}"]) for days in ENDING_WINDOWS})
+
+    for row in rows.values():
+        set_staffing_gaps(row, month_starts, month_ends, today_date)
+
+    return {
+        "months": [str(month_start) for month_start in month_starts],
+        "projects": sorted(rows.values(), key=lambda row: ((row.project_name or row.project).lower(), row.project))
+    }
+
+def get_projects(filters):
+    project_filters = {}
+    if filters.get("projects"):
+        project_filters["name"] = ["in", filters["projects"]]
+    if filters.get("project_status"):
+        project_filters["status"] = filters["project_status"]
+
+    return frappe.get_all(
+        "Project",
+        filters=project_filters,
+        fields=["name", "project_name", "expected_end_date"]
+    )
+
+def set_staffing_gaps(row, month_starts, month_ends, today_date):
+    """Flag months from now until the expected end of the project that are staffed below today's level"""
+    end_date = getdate(row.expected_end_date) if row.expected_end_date else None
+    gaps = []
+    for month_start, month_end, planned_fte in zip(month_starts, month_ends, row.planned_fte):
+        if end_date and month_start > end_date:
+            break
+        if month_end < today_date:
+            continue
+        shortfall = flt(row.current_fte - planned_fte, 2)
+        if shortfall > 0:
+            gaps.append((month_start, shortfall))
+
+    row.gap_months = len(gaps)
+    row.first_gap_month = str(gaps[0][0]) if gaps else None
+    row.max_gap_fte = max([shortfall for month_start, shortfall in gaps], default=0)
+
+def get_columns(rollup):
+    """Return the project columns followed by one planned FTE column per month"""
+    columns = [
+        {
+            "fieldname": "project",
+            "label": _("Project"),
+            "fieldtype": "Link",
+            "options": "Project",
+            "width": 120
+        },
+        {
+            "fieldname": "project_name",
+            "label": _("Project Name"),
+            "fieldtype": "Data",
+            "width": 180
+        },
+        {
+            "fieldname": "expected_end_date",
+            "label": _("Expected End"),
+            "fieldtype": "Date",
+            "width": 100
+        },
+        {
+            "fieldname": "headcount",
+            "label": _("Headcount"),
+            "fieldtype": "Int",
+            "width": 90
+        },
+        {
+            "fieldname": "current_fte",
+            "label": _("Current FTE"),
+            "fieldtype": "Float",
+            "precision": 2,
+            "width": 100
+        }
+    ]
+
+    for days in ENDING_WINDOWS:
+        columns.append({
+            "fieldname": f"ending_{days}",
+            "label": _("Ending in {0} Days").format(days),
+            "fieldtype": "Int",
+            "width": 110
+        })
+
+    for month, month_start in enumerate(rollup["months"]):
+        columns.append({
+            "fieldname": f"m{month}",
+            "label": getdate(month_start).strftime("%b %Y"),
+            "fieldtype": "Float",
+            "precision": 2,
+            "width": 90
+        })
+
+    columns.extend([
+        {
+            "fieldname": "gap_months",
+            "label": _("Gap Months"),
+            "fieldtype": "Int",
+            "width": 90
+        },
+        {
+            "fieldname": "first_gap_month",
+            "label": _("First Gap"),
+            "fieldtype": "Date",
+            "width": 100
+        },
+        {
+            "fieldname": "max_gap_fte",
+            "label": _("Max FTE Gap"),
+            "fieldtype": "Float",
+            "precision": 2,
+            "width": 100
+        }
+    ])
+
+    return columns
+
+def get_data(rollup):
+    data = []
+    for row in rollup["projects"]:
+        values = {key: value for key, value in row.items() if key != "planned_fte"}
+        values.update({f"m{month}": value for month, value in enumerate(row["planned_fte"])})
+        data.append(values)
+
+    return data
+
+def get_chart_data(rollup):
+    """Total planned FTE per month across the selected projects"""
+    if not rollup["projects"]:
+        return None
+
+    monthly_totals = [sum(column) for column in zip(*[row["planned_fte"] for row in rollup["projects"]])]
+
+    return {
+        "type": "bar",
+        "data": {
+            "labels": [getdate(month_start).strftime("%b %Y") for month_start in rollup["months"]],
+            "datasets": [
+                {
+                    "name": _("Planned FTE"),
+                    "values": [flt(total, 2) for total in monthly_totals]
+                }
+            ]
+        },
+        "colors": ["#5e64ff"],
+        "height": 250
+    }
+
+def get_report_summary(rollup):
+    projects = rollup["projects"]
+
+    return [
+        {
+            "value": len(projects),
+            "label": _("Projects"),
+            "indicator": "Blue",
+            "datatype": "Int"
+        },
+        {
+            "value": flt(sum(row["current_fte"] for row in projects), 2),
+            "label": _("Current FTE"),
+            "indicator": "Purple",
+            "datatype": "Float"
+        },
+        {
+            "value": sum(row[f"ending_{ENDING_WINDOWS[0]}"] for row in projects),
+            "label": _("Assignments Ending in {0} Days").format(ENDING_WINDOWS[0]),
+            "indicator": "Orange",
+            "datatype": "Int"
+        },
+        {
+            "value": len([row for row in projects if row["gap_months"]]),
+            "label": _("Projects with Staffing Gaps"),
+            "indicator": "Red",
+            "datatype": "Int"
+        }
+    ]
@@ -40,8 +40,37 @@ frappe.query_reports["Resource Allocation Status"] = {
             "label": __("Status"),
             "fieldtype": "Select",
             "options": "\nActive\nCompleted\nCancelled"
+        },
+        {
+            "fieldname": "include_archived",
+            "label": __("Include Archived"),
+            "fieldtype": "Check",
+            "default": 0
+        },
+        {
+            "fieldname": "as_of",
+            "label": __("As Of"),
+            "fieldtype": "Date",
+            "description": __("Show the plan as it stood at the end of this date")
         }
     ],
+    onload: function(report) {
+        // Patch the affected employees' rows and the cost chart from assignment deltas
+        frappe.realtime.doctype_subscribe("Project Assignment");
+        frappe.realtime.on("rm_ivalue_assignment_delta", function(delta) {
+            if (frappe.query_report !== report || !report.datatable || report.get_filter_value("as_of")) {
+                return;
+            }
+
+            // Archived rows are not part of deltas, so those views are re-run instead
+            if (delta.refresh || report.get_filter_value("include_archived")) {
+                refresh_allocation_status(report);
+                return;
+            }
+
+            apply_allocation_delta(report, delta);
+        });
+    },
     "formatter": function(value, row, column, data, default_formatter) {
         value = default_formatter(value, row, column, data);
         
@@ -85,3 +114,46 @@ frappe.query_reports["Resource Allocation Status"] = {
         return value;
     }
 };
+
+const refresh_allocation_status = frappe.utils.debounce(report => report.refresh(), 2000);
+
+function apply_allocation_delta(report, delta) {
+    let employees = new Set(delta.employees);
+    let data = report.data.filter(row => !employees.has(row.employee));
+    delta.allocation_rows
+        .filter(row => matches_allocation_filters(report, row))
+        .forEach(row => data.push(row));
+    data.sort((a, b) => (b.start_date || "").localeCompare(a.start_date || ""));
+
+    report.data = data;
+    report.datatable.refresh(data);
+
+    if (report.chart) {
+        report.chart.update(get_project_cost_chart_data(data));
+    }
+}
+
+// Mirrors get_conditions in resource_allocation_status.py
+function matches_allocation_filters(report, row) {
+    let filters = report.get_filter_values();
+    return (!filters.employee || row.employee === filters.employee)
+        && (!filters.project || row.project === filters.project)
+        && (!filters.department || row.department === filters.department)
+        && (!filters.status || row.status === filters.status)
+        && (!filters.from_date || row.start_date >= filters.from_date)
+        && (!filters.to_date || row.end_date <= filters.to_date);
+}
+
+// Mirrors get_chart_data in resource_allocation_status.py
+function get_project_cost_chart_data(data) {
+    let costs = {};
+    data.forEach(row => {
+        let project = row.project_name || row.project;
+        costs[project] = (costs[project] || 0) + (row.estimated_cost || 0);
+    });
+
+    return {
+        labels: Object.keys(costs),
+        datasets: [{ values: Object.values(costs) }]
+    };
+}
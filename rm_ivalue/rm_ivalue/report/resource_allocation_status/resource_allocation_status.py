@@ -3,17 +3,39 @@
 
 import frappe
 from frappe import _
-from frappe.utils import getdate, nowdate, add_days, date_diff, flt
+from frappe.utils import getdate, nowdate, add_days, flt
+from rm_ivalue.rm_ivalue.assignment_history import get_as_of_assignments_query, get_as_of_cutoff
+from rm_ivalue.rm_ivalue.costing import get_project_costs
+from rm_ivalue.rm_ivalue.replica import replica_read
+from rm_ivalue.rm_ivalue.utils import SectionTimer
+from rm_ivalue.rm_ivalue.working_days import count_working_days, get_holiday_lists
 
+# Filters that select a subset of a project's assignments
+ROW_FILTERS = ("employee", "department", "status", "from_date", "to_date")
+
+@replica_read
 def execute(filters=None):
     if not filters:
         filters = {}
         
+    timer = SectionTimer("Resource Allocation Status")
+    
     columns = get_columns()
-    data = get_data(filters)
     
-    chart_data = get_chart_data(data)
+    # Whole-project totals, archived assignments included, come from the cached
+    # rollups; any narrower view sums the costs of its rows while building them
+    use_rollups = (filters.get("include_archived") and not filters.get("as_of")
+        and not any(filters.get(key) for key in ROW_FILTERS))
+    project_costs = None if use_rollups else {}
+    
+    with timer.section("data"):
+        data = get_data(filters, project_costs)
+    with timer.section("chart"):
+        if use_rollups:
+            project_costs = get_project_cost_totals(data)
+        chart_data = get_chart_data(project_costs)
     
+    timer.log()
     return columns, data, None, chart_data
 
 def get_columns():
@@ -91,18 +113,18 @@ def get_columns():
     
     return columns
 
-def get_data(filters):
+def get_data(filters, project_costs=None):
     """Get data based on filters"""
-    conditions = get_conditions(filters)
+    conditions, values = get_conditions(filters)
     
-    # Query for Project Assignments
+    # Names and department are the copies kept on the assignment, so no joins are needed
     data = frappe.db.sql("""
         SELECT 
             pa.employee,
-            emp.employee_name,
-            emp.department,
+            pa.employee_name,
+            pa.department,
             pa.project,
-            proj.project_name,
+            pa.project_name,
             pa.start_date,
             pa.end_date,
             pa.allocation_percentage,
@@ -110,68 +132,106 @@ def get_data(filters):
             pa.estimated_total_cost as estimated_cost,
             pa.name as assignment_id
         FROM 
-            `tabProject Assignment` pa
-        LEFT JOIN 
-            `tabEmployee` emp ON pa.employee = emp.name
-        LEFT JOIN 
-            `tabProject` proj ON pa.project = proj.name
+            {assignment_source} pa
         WHERE 
             pa.docstatus = 1
             {conditions}
         ORDER BY 
             pa.start_date DESC
-    """.format(conditions=conditions), as_dict=1)
+    """.format(assignment_source=get_assignment_source(filters), conditions=conditions), values, as_dict=1)
     
-    # Calculate remaining days for each assignment
-    today = getdate(nowdate())
+    # Calculate remaining working days for each assignment from the cached calendars,
+    # counted from the as-of date when looking at a past plan
+    today = getdate(filters.get("as_of") or nowdate())
+    tomorrow = add_days(today, 1)
+    holiday_lists = get_holiday_lists([row.employee for row in data])
     for row in data:
         end_date = getdate(row.end_date)
         
         if today > end_date:
             row.remaining_days = 0
         else:
-            row.remaining_days = date_diff(end_date, today)
+            row.remaining_days = count_working_days(
+                max(tomorrow, getdate(row.start_date)), end_date, holiday_lists.get(row.employee)
+            )
+        
+        if project_costs is not None:
+            project = row.project_name or row.project
+            project_costs[project] = project_costs.get(project, 0) + flt(row.estimated_cost)
     
     return data
 
+def get_assignment_source(filters):
+    """Read from the live table, from live and archived assignments together, or from the plan as of a date"""
+    if filters.get("as_of"):
+        # History rows outlive archiving, so this already covers archived assignments.
+        # They carry no names, so past plans are labelled with the current ones.
+        return """(
+            SELECT hist.*, emp.employee_name, emp.department, proj.project_name
+            FROM ({query}) hist
+            LEFT JOIN `tabEmployee` emp ON emp.name = hist.employee
+            LEFT JOIN `tabProject` proj ON proj.name = hist.project
+        )""".format(query=get_as_of_assignments_query())
+    
+    if not filters.get("include_archived"):
+        return "`tabProject Assignment`"
+    
+    columns = """name, employee, employee_name, department, project, project_name,
+        start_date, end_date, allocation_percentage, status, estimated_total_cost"""
+    
+    return """(
+            SELECT {columns}, docstatus FROM `tabProject Assignment`
+            UNION ALL
+            SELECT {columns}, 1 as docstatus FROM `tabArchived Project Assignment`
+        )""".format(columns=columns)
+
 def get_conditions(filters):
-    """Build conditions for SQL query based on filters"""
+    """Build conditions and their values for SQL query based on filters"""
     conditions = []
+    values = {
+        key: filters.get(key)
+        for key in ("employee", "employees", "project", "department", "status", "from_date", "to_date")
+        if filters.get(key)
+    }
     
     if filters.get("employee"):
-        conditions.append(" AND pa.employee = '{0}'".format(filters.get("employee")))
+        conditions.append(" AND pa.employee = %(employee)s")
+    
+    # Realtime deltas rebuild the rows of a few employees only
+    if filters.get("employees"):
+        conditions.append(" AND pa.employee IN %(employees)s")
     
     if filters.get("project"):
-        conditions.append(" AND pa.project = '{0}'".format(filters.get("project")))
+        conditions.append(" AND pa.project = %(project)s")
     
     if filters.get("department"):
-        conditions.append(" AND emp.department = '{0}'".format(filters.get("department")))
+        conditions.append(" AND pa.department = %(department)s")
     
     if filters.get("status"):
-        conditions.append(" AND pa.status = '{0}'".format(filters.get("status")))
+        conditions.append(" AND pa.status = %(status)s")
     
     if filters.get("from_date"):
-        conditions.append(" AND pa.start_date >= '{0}'".format(filters.get("from_date")))
+        conditions.append(" AND pa.start_date >= %(from_date)s")
     
     if filters.get("to_date"):
-        conditions.append(" AND pa.end_date <= '{0}'".format(filters.get("to_date")))
+        conditions.append(" AND pa.end_date <= %(to_date)s")
+    
+    if filters.get("as_of"):
+        values["as_of_cutoff"] = get_as_of_cutoff(filters.get("as_of"))
     
-    return " ".join(conditions)
+    return " ".join(conditions), values
+
+def get_project_cost_totals(data):
+    """Get cached project cost rollups keyed by project label"""
+    labels = {row.project: row.project_name or row.project for row in data}
+    costs = get_project_costs(list(labels))
+    return {labels[project]: cost for project, cost in costs.items()}
 
-def get_chart_data(data):
-    """Generate chart data for the report"""
-    if not data:
+def get_chart_data(projects):
+    """Generate chart data for the report from per-project cost totals"""
+    if not projects:
         return None
     
-    # Prepare data for Project-wise allocation chart
-    projects = {}
-    for row in data:
-        project = row.project_name or row.project
-        if project in projects:
-            projects[project] += flt(row.estimated_cost)
-        else:
-            projects[project] = flt(row.estimated_cost)
-    
     project_labels = list(projects.keys())
     project_values = [projects[project] for project in project_labels]
     
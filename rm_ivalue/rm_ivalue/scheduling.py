@@ -0,0 +1,139 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import heapq
+
+import frappe
+from frappe.utils import add_days, cint, flt, getdate, today
+from rm_ivalue.rm_ivalue.allocation import (
+    find_earliest_start,
+    get_allocation_segments,
+    get_peak_allocation,
+)
+from rm_ivalue.rm_ivalue.utils import parse_list
+
+@frappe.whitelist()
+def propose_assignment_slots(project, allocation_percentage, duration_days, employees=None,
+                             department=None, designation=None, earliest_start=None,
+                             horizon_days=180, limit=10, draft_count=0):
+    """Propose the earliest feasible (employee, start date) options for a new assignment.
+
+    When draft_count is set, draft Project Assignments are created for that
+    many of the best options and their names returned as draft_assignment."""
+    if not frappe.has_permission("Project Assignment", "read"):
+        frappe.throw("Not enough permissions to read Project Assignment")
+
+    allocation_percentage = flt(allocation_percentage)
+    duration_days = cint(duration_days)
+    if allocation_percentage <= 0 or allocation_percentage > 100:
+        frappe.throw("Allocation Percentage must be between 0% and 100%")
+    if duration_days <= 0:
+        frappe.throw("Duration must be at least one day")
+
+    earliest_start = getdate(earliest_start or today())
+    latest_start = add_days(earliest_start, cint(horizon_days))
+
+    candidates = get_candidate_employees(parse_list(employees), department, designation)
+    if not candidates:
+        return []
+
+    skylines = get_employee_skylines(
+        list(candidates), earliest_start, add_days(latest_start, duration_days - 1)
+    )
+
+    # Earliest start first, then the least loaded employee over the proposed window
+    heap = []
+    for employee in candidates:
+        segments = skylines.get(employee, [])
+        start_date = find_earliest_start(
+            segments, allocation_percentage, duration_days, earliest_start, latest_start
+        )
+        if not start_date:
+            continue
+
+        end_date = add_days(start_date, duration_days - 1)
+        peak_allocation = get_peak_allocation(segments, start_date, end_date)
+        heapq.heappush(heap, (start_date, peak_allocation, employee, end_date))
+
+    options = []
+    for start_date, peak_allocation, employee, end_date in heapq.nsmallest(cint(limit) or 10, heap):
+        options.append({
+            "employee": employee,
+            "employee_name": candidates[employee],
+            "start_date": start_date,
+            "end_date": end_date,
+            "allocation_percentage": allocation_percentage,
+            "current_peak_allocation": peak_allocation,
+            "projected_peak_allocation": peak_allocation + allocation_percentage
+        })
+
+    draft_count = max(cint(draft_count), 0)
+    if draft_count and options:
+        names = create_draft_assignments(project, allocation_percentage, options[:draft_count])
+        for option, name in zip(options, names):
+            option["draft_assignment"] = name
+
+    return options
+
+@frappe.whitelist()
+def create_draft_assignments(project, allocation_percentage, options):
+    """Create draft Project Assignments for the chosen scheduling options"""
+    if not frappe.has_permission("Project Assignment", "create"):
+        frappe.throw("Not enough permissions to create Project Assignment")
+
+    names = []
+    for option in parse_list(options):
+        option = frappe._dict(option)
+        assignment = frappe.get_doc({
+            "doctype": "Project Assignment",
+            "project": project,
+            "employee": option.employee,
+            "start_date": option.start_date,
+            "end_date": option.end_date,
+            "allocation_percentage": flt(allocation_percentage),
+            "allocation_reference": "Created by assignment scheduler"
+        })
+        assignment.insert()
+        names.append(assignment.name)
+
+    return names
+
+def get_candidate_employees(employees=None, department=None, designation=None):
+    """Get the candidate pool as a mapping of employee to employee name"""
+    filters = {"status": "Active"}
+    if employees:
+        filters["name"] = ["in", employees]
+    if department:
+        filters["department"] = department
+    if designation:
+        filters["designation"] = designation
+
+    return {
+        employee.name: employee.employee_name
+        for employee in frappe.get_all("Employee", filters=filters, fields=["name", "employee_name"])
+    }
+
+def get_employee_skylines(employees, start_date, end_date):
+    """Build the allocation skyline of every employee from one range query"""
+    assignments = frappe.db.sql("""
+        SELECT employee, allocation_percentage, start_date, end_date
+        FROM `tabProject Assignment`
+        WHERE employee IN %(employees)s
+        AND docstatus = 1
+        AND start_date <= %(end_date)s
+        AND end_date >= %(start_date)s
+        ORDER BY employee, start_date
+    """, {
+        "employees": employees,
+        "start_date": start_date,
+        "end_date": end_date
+    }, as_dict=True)
+
+    employee_assignments = {}
+    for assignment in assignments:
+        employee_assignments.setdefault(assignment.employee, []).append(assignment)
+
+    return {
+        employee: get_allocation_segments(rows)
+        for employee, rows in employee_assignments.items()
+    }
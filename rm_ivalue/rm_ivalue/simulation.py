@@ -0,0 +1,205 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.utils import add_days, date_diff, flt, getdate, today
+from rm_ivalue.rm_ivalue.allocation import get_allocation_segments, get_overlap_days
+from rm_ivalue.rm_ivalue.utils import parse_list
+
+CHANGE_TYPES = ("end_date", "allocation", "new_assignment")
+
+class SimulationError(frappe.ValidationError):
+    """A hypothetical change that the change request rules would reject"""
+
+@frappe.whitelist()
+def simulate_changes(changes, project=None, employees=None, from_date=None, to_date=None):
+    """Apply hypothetical change requests in memory and report the capacity impact without writing anything.
+
+    Each change is a dict with a "type" of:
+    - "end_date": assignment, new_end_date
+    - "allocation": assignment, new_allocation_percentage, effective_date
+    - "new_assignment": employee, project, start_date, end_date, allocation_percentage
+    """
+    if not frappe.has_permission("Project Assignment", "read"):
+        frappe.throw("Not enough permissions to read Project Assignment")
+
+    changes = [frappe._dict(change) for change in parse_list(changes)]
+    window_start = getdate(from_date or today())
+    window_end = getdate(to_date) if to_date else add_days(window_start, 89)
+    if window_end < window_start:
+        frappe.throw("To Date cannot be before From Date")
+
+    affected_employees = get_affected_employees(changes, project, parse_list(employees), window_start)
+    model = load_interval_model(affected_employees, window_start, window_end)
+    before = {employee: summarize(assignments, window_start, window_end) for employee, assignments in model.items()}
+
+    errors = []
+    for index, change in enumerate(changes):
+        try:
+            apply_change(model, change, index)
+        except SimulationError as e:
+            errors.append({"change": index, "error": str(e)})
+
+    result = {}
+    for employee, assignments in model.items():
+        after = summarize(assignments, window_start, window_end)
+        result[employee] = {
+            "before": before[employee],
+            "after": after,
+            "utilization_delta": flt(after["utilization"] - before[employee]["utilization"], 2),
+            "changed": after != before[employee]
+        }
+
+    return {
+        "from_date": window_start,
+        "to_date": window_end,
+        "employees": result,
+        "overallocated_employees": sorted(
+            employee for employee, impact in result.items() if impact["after"]["overallocated_periods"]
+        ),
+        "errors": errors
+    }
+
+def get_affected_employees(changes, project=None, employees=None, window_start=None):
+    """Collect employees touched by the changes, staffed on the project or listed explicitly"""
+    affected = set(employees or [])
+
+    assignment_names = [change.assignment for change in changes if change.assignment]
+    if assignment_names:
+        affected.update(frappe.get_all(
+            "Project Assignment",
+            filters={"name": ["in", assignment_names]},
+            pluck="employee"
+        ))
+
+    affected.update(change.employee for change in changes if change.type == "new_assignment" and change.employee)
+
+    if project:
+        affected.update(frappe.get_all(
+            "Project Assignment",
+            filters={
+                "project": project,
+                "docstatus": 1,
+                "end_date": [">=", window_start]
+            },
+            pluck="employee",
+            distinct=True
+        ))
+
+    return affected
+
+def load_interval_model(employees, window_start, window_end):
+    """Load submitted assignments of the employees that intersect the window, keyed by employee and name"""
+    model = {employee: {} for employee in employees}
+    if not employees:
+        return model
+
+    assignments = frappe.db.sql("""
+        SELECT name, employee, project, start_date, end_date, allocation_percentage
+        FROM `tabProject Assignment`
+        WHERE employee IN %(employees)s
+        AND docstatus = 1
+        AND start_date <= %(window_end)s
+        AND end_date >= %(window_start)s
+    """, {
+        "employees": list(employees),
+        "window_start": window_start,
+        "window_end": window_end
+    }, as_dict=True)
+
+    for assignment in assignments:
+        assignment.start_date = getdate(assignment.start_date)
+        assignment.end_date = getdate(assignment.end_date)
+        model[assignment.employee][assignment.name] = assignment
+
+    return model
+
+def apply_change(model, change, index):
+    """Apply one hypothetical change to the in-memory model, mirroring the change request rules"""
+    if change.type not in CHANGE_TYPES:
+        raise SimulationError(f"Unknown change type: {change.type}")
+
+    if change.type == "new_assignment":
+        allocation_percentage = flt(change.allocation_percentage)
+        if change.employee not in model:
+            raise SimulationError("Employee is required for a new assignment")
+        if getdate(change.end_date) < getdate(change.start_date):
+            raise SimulationError("End Date cannot be before Start Date")
+        if allocation_percentage < 0 or allocation_percentage > 100:
+            raise SimulationError("Allocation Percentage must be between 0% and 100%")
+
+        model[change.employee][f"new-{index}"] = frappe._dict({
+            "name": f"new-{index}",
+            "employee": change.employee,
+            "project": change.project,
+            "start_date": getdate(change.start_date),
+            "end_date": getdate(change.end_date),
+            "allocation_percentage": allocation_percentage
+        })
+        return
+
+    assignment = find_assignment(model, change.assignment)
+
+    if change.type == "end_date":
+        if getdate(change.new_end_date) <= assignment.start_date:
+            raise SimulationError("New end date must be after start date")
+        assignment.end_date = getdate(change.new_end_date)
+        return
+
+    effective_date = getdate(change.effective_date)
+    new_allocation_percentage = flt(change.new_allocation_percentage)
+    if effective_date <= assignment.start_date:
+        raise SimulationError("Effective date must be after current start date")
+    if effective_date > assignment.end_date:
+        raise SimulationError("Effective date cannot be after end date")
+    if new_allocation_percentage < 0 or new_allocation_percentage > 100:
+        raise SimulationError("Allocation percentage must be between 0% and 100%")
+
+    model[assignment.employee][f"new-{index}"] = frappe._dict({
+        "name": f"new-{index}",
+        "employee": assignment.employee,
+        "project": assignment.project,
+        "start_date": effective_date,
+        "end_date": assignment.end_date,
+        "allocation_percentage": new_allocation_percentage
+    })
+    assignment.end_date = add_days(effective_date, -1)
+
+def find_assignment(model, name):
+    """Find a loaded assignment by name in the in-memory model"""
+    for assignments in model.values():
+        if name in assignments:
+            return assignments[name]
+
+    raise SimulationError(f"Assignment {name} is not submitted or does not overlap the simulation window")
+
+def summarize(assignments, window_start, window_end):
+    """Get peak allocation, utilization and over-allocated periods of an employee within the window"""
+    assignments = list(assignments.values())
+    window_days = date_diff(window_end, window_start) + 1
+
+    person_days = sum(
+        flt(assignment.allocation_percentage)
+        * get_overlap_days(assignment.start_date, assignment.end_date, window_start, window_end)
+        for assignment in assignments
+    )
+
+    peak_allocation = 0
+    overallocated_periods = []
+    for segment_start, segment_end, allocation in get_allocation_segments(assignments):
+        if segment_end < window_start or segment_start > window_end:
+            continue
+        peak_allocation = max(peak_allocation, allocation)
+        if allocation > 100:
+            overallocated_periods.append({
+                "from_date": max(segment_start, window_start),
+                "to_date": min(segment_end, window_end),
+                "allocation": allocation
+            })
+
+    return {
+        "assignments": len(assignments),
+        "peak_allocation": peak_allocation,
+        "utilization": flt(person_days / window_days, 2),
+        "overallocated_periods": overallocated_periods
+    }
@@ -0,0 +1,126 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.utils import cint, now_datetime
+
+STATUS_ORDER = ("Planned", "Active", "Completed")
+
+def get_counter_deltas(old_state=None, new_state=None, deltas=None):
+    """Add the counter change of one assignment moving between (status, docstatus) states.
+
+    A state of None means the assignment does not exist; cancelled
+    assignments are not counted, matching the docstatus != 2 summary."""
+    deltas = deltas if deltas is not None else {}
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        if not state or cint(state[1]) == 2:
+            continue
+        status, docstatus = state
+        counts = deltas.setdefault(status, [0, 0])
+        counts[0] += sign
+        if cint(docstatus) == 1:
+            counts[1] += sign
+
+    return deltas
+
+def apply_counter_deltas(deltas):
+    """Apply counter deltas inside the current transaction.
+
+    Counter rows are locked in status order, so transactions moving
+    assignments in opposite directions cannot deadlock on them."""
+    for status, (total, submitted) in sorted(deltas.items(), key=lambda item: item[0] or ""):
+        if not status or (not total and not submitted):
+            continue
+
+        frappe.db.sql("""
+            INSERT INTO `tabProject Assignment Status Counter`
+                (name, status, total_count, submitted_count, docstatus, idx,
+                creation, modified, owner, modified_by)
+            VALUES
+                (%(status)s, %(status)s, %(total)s, %(submitted)s, 0, 0,
+                %(now)s, %(now)s, 'Administrator', 'Administrator')
+            ON DUPLICATE KEY UPDATE
+                total_count = total_count + VALUES(total_count),
+                submitted_count = submitted_count + VALUES(submitted_count),
+                modified = VALUES(modified)
+        """, {
+            "status": status,
+            "total": total,
+            "submitted": submitted,
+            "now": now_datetime()
+        })
+
+def update_counters(old_state=None, new_state=None):
+    """Move one assignment between (status, docstatus) states in the counters"""
+    apply_counter_deltas(get_counter_deltas(old_state, new_state))
+
+def get_status_summary():
+    """Get the per-status summary from the counters"""
+    counters = {
+        row.status: row for row in frappe.get_all(
+            "Project Assignment Status Counter",
+            fields=["status", "total_count", "submitted_count"]
+        )
+    }
+
+    ordered_statuses = [status for status in STATUS_ORDER if status in counters]
+    ordered_statuses += sorted(status for status in counters if status not in STATUS_ORDER)
+
+    return [
+        {
+            "status": status,
+            "count": counters[status].total_count,
+            "submitted_count": counters[status].submitted_count
+        }
+        for status in ordered_statuses
+        if counters[status].total_count
+    ]
+
+def get_actual_counts():
+    """Count assignments per status straight from the table"""
+    rows = frappe.db.sql("""
+        SELECT
+            status,
+            COUNT(*) as count,
+            COUNT(CASE WHEN docstatus = 1 THEN 1 END) as submitted_count
+        FROM `tabProject Assignment`
+        WHERE docstatus != 2
+        GROUP BY status
+    """, as_dict=True)
+
+    return {row.status: (cint(row.count), cint(row.submitted_count)) for row in rows}
+
+def reconcile_status_counters(repair=True):
+    """Compare the counters with a real GROUP BY and optionally repair any drift"""
+    actual = get_actual_counts()
+    stored = {
+        row.status: (cint(row.total_count), cint(row.submitted_count))
+        for row in frappe.get_all(
+            "Project Assignment Status Counter",
+            fields=["status", "total_count", "submitted_count"]
+        )
+    }
+
+    drift = []
+    deltas = {}
+    for status in set(actual) | set(stored):
+        expected = actual.get(status, (0, 0))
+        current = stored.get(status, (0, 0))
+        if expected == current:
+            continue
+
+        drift.append({
+            "status": status,
+            "count": current[0],
+            "expected_count": expected[0],
+            "submitted_count": current[1],
+            "expected_submitted_count": expected[1]
+        })
+        deltas[status] = [expected[0] - current[0], expected[1] - current[1]]
+
+    if drift:
+        frappe.logger("rm_ivalue").warning({"status_counter_drift": drift, "repaired": bool(repair)})
+        if repair:
+            apply_counter_deltas(deltas)
+
+    return drift
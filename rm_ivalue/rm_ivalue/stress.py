@@ -0,0 +1,164 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import frappe
+from frappe.utils import add_days, cint, date_diff, flt, getdate, today
+
+# Request outcomes counted per worker
+OUTCOMES = ("committed", "conflict", "rejected", "lock_timeout", "error")
+
+def run_change_request_stress(site, sites_path, employee, project, workers=8, requests=25, days=365):
+    """Hammer one submitted assignment with allocation change requests from parallel processes.
+
+    Half of the requests carry the modified timestamp the worker read, so
+    they exercise the stale-edit check; the other half rely on the row lock
+    alone. Every committed request must leave the assignment and its splits
+    tiling the original date range exactly once. Run on a test site only,
+    the assignments it creates are left in place for inspection."""
+    root = frappe.get_doc({
+        "doctype": "Project Assignment",
+        "employee": employee,
+        "project": project,
+        "start_date": today(),
+        "end_date": add_days(today(), cint(days) - 1),
+        "allocation_percentage": 50,
+        "allocation_reference": "Change request stress test"
+    })
+    root.insert()
+    root.submit()
+    frappe.db.commit()
+
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        results = list(executor.map(
+            run_stress_worker,
+            [site] * workers,
+            [sites_path] * workers,
+            [root.name] * workers,
+            range(workers),
+            [cint(requests)] * workers
+        ))
+    seconds = time.monotonic() - started
+
+    # Start a new snapshot so the check sees every worker's commits
+    frappe.db.rollback()
+
+    outcomes = {outcome: sum(result["outcomes"][outcome] for result in results) for outcome in OUTCOMES}
+    latencies = sorted(latency for result in results for latency in result["latencies"])
+    errors = [error for result in results for error in result["errors"]]
+
+    return {
+        "database": get_database_settings(),
+        "assignment": root.name,
+        "workers": workers,
+        "requests": workers * cint(requests),
+        "seconds": round(seconds, 2),
+        "outcomes": outcomes,
+        "throughput": flt(outcomes["committed"] / seconds, 2) if seconds else 0,
+        "p50_ms": get_percentile(latencies, 50),
+        "p95_ms": get_percentile(latencies, 95),
+        "errors": errors[:20],
+        "problems": check_split_chain(root.name, root.start_date, root.end_date, outcomes["committed"])
+    }
+
+def run_stress_worker(site, sites_path, assignment_name, worker, requests):
+    """Issue change requests against one assignment inside a pool worker"""
+    result = {"outcomes": dict.fromkeys(OUTCOMES, 0), "latencies": [], "errors": []}
+    rng = random.Random(worker)
+
+    try:
+        frappe.init(site=site, sites_path=sites_path)
+        frappe.connect()
+        frappe.set_user("Administrator")
+
+        for index in range(requests):
+            # A plain read, possibly stale by the time the change request locks the row
+            assignment = frappe.get_doc("Project Assignment", assignment_name)
+            span = date_diff(assignment.end_date, assignment.start_date)
+            effective_date = add_days(assignment.start_date, rng.randint(1, max(span, 1)))
+            expected_modified = assignment.modified if index % 2 else None
+
+            started = time.monotonic()
+            try:
+                assignment.create_change_request_for_allocation(
+                    rng.randrange(10, 100, 10), effective_date, f"Stress worker {worker}", expected_modified
+                )
+                frappe.db.commit()
+                outcome = "committed"
+            except frappe.TimestampMismatchError:
+                outcome = "conflict"
+            except (frappe.QueryDeadlockError, frappe.QueryTimeoutError):
+                outcome = "lock_timeout"
+            except frappe.ValidationError:
+                # The worker's read was stale and the effective date left the locked range
+                outcome = "rejected"
+            except Exception as e:
+                outcome = "error"
+                result["errors"].append(f"worker {worker}: {e!r}")
+
+            if outcome != "committed":
+                frappe.db.rollback()
+            frappe.local.message_log = []
+            result["outcomes"][outcome] += 1
+            result["latencies"].append(round((time.monotonic() - started) * 1000, 2))
+    except Exception as e:
+        result["errors"].append(f"worker {worker}: {e!r}")
+    finally:
+        frappe.destroy()
+
+    return result
+
+def check_split_chain(root_name, start_date, end_date, committed):
+    """Check the assignment and its splits tile [start_date, end_date] with one split per committed request"""
+    problems = []
+    splits = frappe.db.sql("""
+        SELECT new_assignment
+        FROM `tabAssignment Change Log`
+        WHERE assignment = %(root)s
+        AND change_type = 'Allocation'
+    """, {"root": root_name}, pluck=True)
+
+    if len(splits) != committed:
+        problems.append(f"{len(splits)} logged splits for {committed} committed change requests")
+    if len(set(splits)) != len(splits):
+        problems.append("A split assignment is logged more than once")
+
+    segments = frappe.get_all(
+        "Project Assignment",
+        filters={"name": ["in", [root_name] + splits], "docstatus": 1},
+        fields=["name", "start_date", "end_date"],
+        order_by="start_date asc, name asc"
+    )
+    if len(segments) != len(splits) + 1:
+        problems.append(f"{len(segments)} submitted segments for {len(splits)} splits")
+
+    expected_start = getdate(start_date)
+    for segment in segments:
+        if getdate(segment.start_date) < expected_start:
+            problems.append(f"{segment.name} overlaps the previous segment from {segment.start_date}")
+        elif getdate(segment.start_date) > expected_start:
+            problems.append(f"Gap before {segment.name} from {expected_start} to {add_days(segment.start_date, -1)}")
+        expected_start = max(expected_start, getdate(add_days(segment.end_date, 1)))
+
+    if segments and getdate(segments[-1].end_date) != getdate(end_date):
+        problems.append(f"Last segment ends on {segments[-1].end_date} instead of {end_date}")
+
+    return problems
+
+def get_database_settings():
+    """Server version and lock settings the throughput and timeouts depend on, reported with the results"""
+    return {
+        "version": frappe.db.sql("SELECT VERSION()")[0][0],
+        "innodb_lock_wait_timeout": cint(frappe.db.sql("SELECT @@innodb_lock_wait_timeout")[0][0]),
+        "transaction_isolation": frappe.db.sql("SELECT @@tx_isolation")[0][0]
+    }
+
+def get_percentile(values, percentile):
+    if not values:
+        return 0
+    return values[min(len(values) - 1, len(values) * percentile // 100)]
@@ -3,19 +3,37 @@
 
 import frappe
 from frappe.utils import getdate, today
+from rm_ivalue.rm_ivalue.archive import archive_completed_assignments
+from rm_ivalue.rm_ivalue.assignment_cache import invalidate_employee_assignments
+from rm_ivalue.rm_ivalue.assignment_deletions import prune_assignment_deletions
+from rm_ivalue.rm_ivalue.assignment_history import record_assignment_states
+from rm_ivalue.rm_ivalue.denormalization import repair_denormalized_attributes
+from rm_ivalue.rm_ivalue.status_counters import (
+    apply_counter_deltas,
+    get_counter_deltas,
+    reconcile_status_counters,
+)
 
 def update_project_assignment_status():
     """Daily task to update status of all submitted Project Assignments"""
+    updated_count = update_assignment_statuses()
+    return f"Successfully updated {updated_count} project assignments"
+
+def update_assignment_statuses():
+    """Update status of all submitted Project Assignments and return how many changed"""
     try:
         # Get all submitted Project Assignments
         assignments = frappe.get_all(
             "Project Assignment",
             filters={"docstatus": 1},  # Only submitted documents
-            fields=["name", "start_date", "end_date", "status"]
+            fields=["name", "employee", "start_date", "end_date", "status"]
         )
         
         today_date = getdate(today())
         updated_count = 0
+        updated_employees = set()
+        updated_names = []
+        counter_deltas = {}
         
         for assignment in assignments:
             start_date = getdate(assignment.start_date)
@@ -37,9 +55,16 @@ def update_project_assignment_status():
                     assignment.name, 
                     "status", 
                     new_status,
-                    update_modified=False  # Don't update modified timestamp
+                    update_modified=True  # Status flips must reach the change feed
                 )
                 updated_count += 1
+                updated_employees.add(assignment.employee)
+                updated_names.append(assignment.name)
+                get_counter_deltas((current_status, 1), (new_status, 1), counter_deltas)
+        
+        invalidate_employee_assignments(updated_employees)
+        apply_counter_deltas(counter_deltas)
+        record_assignment_states(updated_names)
         
         # Commit the changes
         frappe.db.commit()
@@ -48,7 +73,7 @@ def update_project_assignment_status():
         if updated_count > 0:
             frappe.logger().info(f"Updated status for {updated_count} Project Assignments")
         
-        return f"Successfully updated {updated_count} project assignments"
+        return updated_count
         
     except Exception as e:
         frappe.logger().error(f"Error updating Project Assignment status: {str(e)}")
@@ -61,7 +86,23 @@ def all():
 
 def daily():
     """Function that runs daily"""
-    update_project_assignment_status()
+    if frappe.conf.get("rm_ivalue_parallel_daily") and frappe.conf.get("rm_ivalue_daily_coordinator"):
+        # One coordinator site fans the maintenance out to every site of the bench
+        if frappe.local.site == frappe.conf.get("rm_ivalue_daily_coordinator"):
+            frappe.enqueue("rm_ivalue.rm_ivalue.multisite.run_daily_for_bench", queue="long", timeout=6 * 3600)
+        return
+    
+    run_daily_maintenance()
+
+def run_daily_maintenance():
+    """Run the daily maintenance of the current site and report what it did"""
+    updated_count = update_assignment_statuses()
+    drift = reconcile_status_counters(repair=True)
+    frappe.db.commit()
+    repaired_count = repair_denormalized_attributes()
+    frappe.db.commit()
+    
+    return {"updated": updated_count, "drift": len(drift), "repaired": repaired_count}
 
 def hourly():
     """Function that runs hourly"""
@@ -69,7 +110,8 @@ def hourly():
 
 def weekly():
     """Function that runs weekly"""
-    pass
+    archive_completed_assignments()
+    prune_assignment_deletions()
 
 def monthly():
     """Function that runs monthly"""
@@ -0,0 +1,39 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import time
+from contextlib import contextmanager
+
+import frappe
+
+def parse_list(value):
+    """Parse a list argument sent as a JSON array, a comma separated string or a list"""
+    if value is None or value == "":
+        return []
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith("["):
+            return frappe.parse_json(value)
+        return [item.strip() for item in value.split(",") if item.strip()]
+    return list(value)
+
+class SectionTimer:
+    """Collect wall-clock timings of the sections of a report or job"""
+    def __init__(self, name):
+        self.name = name
+        self.timings = {}
+
+    @contextmanager
+    def section(self, label):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[label] = round((time.perf_counter() - start) * 1000, 2)
+
+    def log(self):
+        frappe.logger("rm_ivalue").info({
+            "name": self.name,
+            "timings_ms": self.timings,
+            "total_ms": round(sum(self.timings.values()), 2)
+        })
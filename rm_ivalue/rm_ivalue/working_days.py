@@ -0,0 +1,120 @@
+# Copyright (c) 2023, Yazan Hamdan and contributors
+# For license information, please see license.txt
+
+import calendar
+from datetime import date
+
+import frappe
+from frappe.utils import add_days, getdate, today
+from rm_ivalue.rm_ivalue.replica import hget_cached
+
+WORKING_DAY_CALENDAR_KEY = "rm_ivalue:working_day_calendar"
+
+def count_working_days(start_date, end_date, holiday_list=None):
+    """Count working days between two dates (inclusive) with prefix sums of cached year calendars"""
+    start_date = getdate(start_date)
+    end_date = getdate(end_date)
+    if end_date < start_date:
+        return 0
+
+    working_days = 0
+    for year in range(start_date.year, end_date.year + 1):
+        cumulative = get_year_calendar(holiday_list, year)
+        first_day = start_date.timetuple().tm_yday - 1 if year == start_date.year else 0
+        last_day = end_date.timetuple().tm_yday - 1 if year == end_date.year else len(cumulative) - 1
+        working_days += cumulative[last_day] - (cumulative[first_day - 1] if first_day else 0)
+
+    return working_days
+
+def get_year_calendar(holiday_list, year):
+    """Get the cumulative working-day array of a year for a holiday list, cached in Redis.
+
+    Element i holds the number of working days from 1 January to day i of the year."""
+    return hget_cached(
+        WORKING_DAY_CALENDAR_KEY,
+        f"{holiday_list or ''}:{year}",
+        lambda: build_year_calendar(holiday_list, year)
+    )
+
+def build_year_calendar(holiday_list, year):
+    """Compile a year of a Holiday List into a cumulative working-day array.
+
+    Days outside the holiday list's period, or every day without a holiday
+    list, fall back to a Monday to Friday week."""
+    year_start = date(year, 1, 1)
+    year_end = date(year, 12, 31)
+    holidays = set()
+    list_start = list_end = None
+
+    if holiday_list:
+        period = frappe.db.get_value("Holiday List", holiday_list, ["from_date", "to_date"], as_dict=True)
+        if period:
+            list_start, list_end = getdate(period.from_date), getdate(period.to_date)
+            holidays = {
+                getdate(holiday_date) for holiday_date in frappe.get_all(
+                    "Holiday",
+                    filters={
+                        "parent": holiday_list,
+                        "parenttype": "Holiday List",
+                        "holiday_date": ["between", [year_start, year_end]]
+                    },
+                    pluck="holiday_date"
+                )
+            }
+
+    cumulative = []
+    running = 0
+    for offset in range(366 if calendar.isleap(year) else 365):
+        day = add_days(year_start, offset)
+        if list_start and list_start <= day <= list_end:
+            is_working_day = day not in holidays
+        else:
+            is_working_day = day.weekday() < 5
+
+        running += is_working_day
+        cumulative.append(running)
+
+    return cumulative
+
+def get_holiday_lists(employees):
+    """Get the holiday list of each employee, falling back to the company default, in one query"""
+    employees = [employee for employee in set(employees) if employee]
+    if not employees:
+        return {}
+
+    return dict(frappe.db.sql("""
+        SELECT emp.name, COALESCE(NULLIF(emp.holiday_list, ''), company.default_holiday_list)
+        FROM `tabEmployee` emp
+        LEFT JOIN `tabCompany` company ON company.name = emp.company
+        WHERE emp.name IN %(employees)s
+    """, {"employees": employees}))
+
+def get_assignment_day_counts(start_date, end_date, holiday_list=None, today_date=None):
+    """Get total, elapsed and remaining working days and time progress of an assignment"""
+    today_date = getdate(today_date or today())
+    start_date = getdate(start_date)
+    end_date = getdate(end_date)
+
+    total_days = count_working_days(start_date, end_date, holiday_list)
+    if today_date < start_date:
+        elapsed_days = 0
+        remaining_days = total_days
+    elif today_date > end_date:
+        elapsed_days = total_days
+        remaining_days = 0
+    else:
+        elapsed_days = count_working_days(start_date, today_date, holiday_list)
+        remaining_days = count_working_days(add_days(today_date, 1), end_date, holiday_list)
+
+    progress = (elapsed_days / total_days) * 100 if total_days > 0 else 0
+
+    return {
+        "total_days": total_days,
+        "elapsed_days": elapsed_days,
+        "remaining_days": remaining_days,
+        "progress_percentage": min(100, max(0, progress))
+    }
+
+def clear_working_day_calendar(doc=None, method=None):
+    """Drop compiled calendars when a Holiday List changes"""
+    frappe.cache().delete_value(WORKING_DAY_CALENDAR_KEY)